@@ -0,0 +1,1296 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from classifier import (
+    CompleteCivicIssueDetectionSystem, ImageFeatures, InferenceServer,
+    SpoolDrainer, SupabaseConnector, UploadSpool, YOLO_AVAILABLE, issue_statuses
+)
+
+
+CATEGORIES = ("potholes", "garbage", "street_lights", "waterlogging", "fallen_trees")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+DEFAULT_IMAGE_DIR = "Frontend/html/dataset_mock"
+
+
+def find_images(root: str) -> List[str]:
+    """Recursively list image files under root, sorted for repeatable runs"""
+    return sorted(
+        str(path) for path in Path(root).rglob("*")
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(values: List[float]) -> Dict:
+    """Latency percentiles in milliseconds"""
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1000,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values) * 1000
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def environment_info() -> Dict:
+    """Versions and commit, so result files can be compared across runs"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__
+    }
+
+
+# ==================== SYNTHETIC IMAGES ====================
+
+DEFAULT_RESOLUTIONS = ((640, 480), (1280, 720), (1920, 1080), (4000, 3000))
+
+
+def synthetic_civic_image(width: int, height: int, seed: int) -> np.ndarray:
+    """
+    Draw a deterministic street scene that exercises every mock branch.
+    
+    The scene has a mid-gray road in the lower half (road), a near-black
+    blob (pothole), bright spots in the upper third (light), a blue pool in
+    the lower half (water), one or two tall green masses (tree), a wide brown mass
+    across the road (fallen tree colours) and small saturated squares
+    (clutter / garbage). Each element is toggled and placed from the seed,
+    so a set of seeds covers both positive and negative cases.
+    """
+    rng = np.random.RandomState(seed)
+    img = np.full((height, width, 3), 170, dtype=np.uint8)
+    img[height//2:, :] = 110
+    area = width * height
+    
+    def jitter(low: float, high: float) -> float:
+        return low + (high - low) * rng.rand()
+    
+    if rng.rand() < 0.7:
+        axes = (int(width * jitter(0.12, 0.18)), int(height * jitter(0.08, 0.12)))
+        center = (int(width * jitter(0.2, 0.8)), int(height * jitter(0.65, 0.85)))
+        cv2.ellipse(img, center, axes, 0, 0, 360, (15, 15, 15), -1)
+    
+    if rng.rand() < 0.6:
+        radius = max(2, int(math.sqrt(area * jitter(0.002, 0.01) / math.pi)))
+        for _ in range(rng.randint(1, 4)):
+            center = (int(width * jitter(0.1, 0.9)), int(height * jitter(0.05, 0.25)))
+            cv2.circle(img, center, radius, (245, 245, 245), -1)
+    
+    if rng.rand() < 0.5:
+        x0 = int(width * jitter(0.0, 0.4))
+        y0 = int(height * jitter(0.55, 0.7))
+        img[y0:y0 + int(height * jitter(0.15, 0.3)), x0:x0 + int(width * jitter(0.3, 0.6))] = (180, 90, 30)
+    
+    if rng.rand() < 0.5:
+        for x_low, x_high in ((0.0, 0.3), (0.5, 0.8))[:rng.randint(1, 3)]:
+            x0 = int(width * jitter(x_low, x_high))
+            tree_width = int(width * jitter(0.1, 0.15))
+            img[int(height * 0.05):int(height * 0.58), x0:x0 + tree_width] = (40, 150, 40)
+    
+    if rng.rand() < 0.4:
+        y0 = int(height * jitter(0.6, 0.75))
+        img[y0:y0 + int(height * jitter(0.1, 0.2)), int(width * 0.05):int(width * jitter(0.6, 0.95))] = (30, 70, 140)
+    
+    side = max(2, int(math.sqrt(area * 0.004)))
+    for _ in range(rng.randint(0, 12)):
+        x0 = int(width * jitter(0.0, 0.95))
+        y0 = int(height * jitter(0.3, 0.95))
+        img[y0:y0 + side, x0:x0 + side] = (0, 0, 220)
+    
+    return img
+
+
+def generate_synthetic_images(
+    output_dir: str,
+    resolutions: Tuple[Tuple[int, int], ...] = DEFAULT_RESOLUTIONS,
+    per_resolution: int = 10,
+    seed: int = 0
+) -> List[str]:
+    """
+    Write deterministic synthetic JPEGs, reusing files that already exist.
+    
+    Returns:
+        Paths of the generated images
+    """
+    root = Path(output_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    
+    paths = []
+    for width, height in resolutions:
+        for index in range(per_resolution):
+            path = root / f"synthetic_{width}x{height}_{seed + index:04d}.jpg"
+            if not path.exists():
+                image = synthetic_civic_image(width, height, seed + index)
+                cv2.imwrite(str(path), image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            paths.append(str(path))
+    return paths
+
+
+# ==================== STAGE BENCHMARK ====================
+
+CLASSIFIER_STAGES = (
+    ("classify_potholes", lambda c, a, img, f, b: c._classify_potholes(a, b)),
+    ("classify_garbage", lambda c, a, img, f, b: c._classify_garbage(a, b)),
+    ("classify_street_lights", lambda c, a, img, f, b: c._classify_street_lights(a, img, f, b)),
+    ("classify_waterlogging", lambda c, a, img, f, b: c._classify_waterlogging(a, img, f, b)),
+    ("classify_fallen_trees", lambda c, a, img, f, b: c._classify_fallen_trees(a, img, f, b)),
+)
+
+
+def run_stage_benchmark(
+    image_paths: List[str],
+    system: CompleteCivicIssueDetectionSystem,
+    repeat: int = 1,
+    warmup: int = 2
+) -> Dict:
+    """
+    Time every stage of the per-image path separately.
+    
+    Stages: decode, detect, bucket (label grouping), one entry per
+    _classify_* method, and report generation. total is the sum per image.
+    
+    Returns:
+        Machine-readable benchmark results
+    """
+    vision_model = system.vision_model
+    classifier = system.classifier
+    timings: Dict[str, List[float]] = {}
+    labels = Counter()
+    statuses = Counter()
+    
+    def timed(stage: str, func):
+        start = time.perf_counter()
+        value = func()
+        timings.setdefault(stage, []).append(time.perf_counter() - start)
+        return value
+    
+    for path in image_paths[:warmup]:
+        system.process_image(path, verbose=False)
+    
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        for path in image_paths:
+            image_start = time.perf_counter()
+            
+            img, original_size = timed("decode", lambda: vision_model.read_image(path))
+            features = ImageFeatures(img)
+            analysis = timed("detect", lambda: vision_model.detect(img, features, original_size))
+            buckets = timed("bucket", lambda: classifier.bucket_detections(analysis))
+            
+            result = {}
+            for (stage, classify), category in zip(CLASSIFIER_STAGES, CATEGORIES):
+                result[category] = timed(
+                    stage, lambda: classify(classifier, analysis, img, features, buckets)
+                )
+            timed("report", lambda: system.build_report(path, result))
+            
+            timings.setdefault("total", []).append(time.perf_counter() - image_start)
+            labels.update(obj.label for obj in analysis.detected_objects)
+            statuses.update(f"{category}={value['status']}" for category, value in result.items())
+    wall = time.perf_counter() - wall_start
+    
+    processed = len(image_paths) * repeat
+    return {
+        "benchmark": "stages",
+        "environment": environment_info(),
+        "model_type": vision_model.model_type,
+        "analysis_size": vision_model.analysis_size,
+        "image_count": len(image_paths),
+        "repeat": repeat,
+        "stages": {stage: latency_summary(values) for stage, values in timings.items()},
+        "images_per_sec": processed / wall if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "coverage": {
+            "labels": dict(sorted(labels.items())),
+            "statuses": dict(sorted(statuses.items()))
+        }
+    }
+
+
+def print_stage_table(report: Dict):
+    print("\n" + "PER-STAGE LATENCY".center(60))
+    print("="*60)
+    print(f"Model: {report['model_type']}   Images: {report['image_count']} x {report['repeat']}")
+    print("-"*60)
+    print(f"{'stage':<24} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for stage, summary in report["stages"].items():
+        print(f"{stage:<24} {summary['p50_ms']:>10.3f} {summary['p95_ms']:>10.3f} {summary['p99_ms']:>10.3f}")
+    print("-"*60)
+    print(f"Throughput: {report['images_per_sec']:.1f} images/sec")
+    print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+    print("="*60)
+
+
+def compare_reports(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    """
+    Compare two stage reports.
+    
+    Returns:
+        Descriptions of stages whose p50 or p95 grew by more than threshold percent
+    """
+    print("\n" + "STAGE COMPARISON".center(60))
+    print("="*60)
+    print(f"{'stage':<24} {'p50 delta':>12} {'p95 delta':>12}")
+    
+    regressions = []
+    for stage, summary in current["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before is None:
+            continue
+        
+        deltas = []
+        for key in ("p50_ms", "p95_ms"):
+            delta = (summary[key] / before[key] - 1) * 100 if before[key] else 0.0
+            deltas.append(delta)
+            if delta > threshold:
+                regressions.append(f"{stage} {key} +{delta:.1f}%")
+        print(f"{stage:<24} {deltas[0]:>+11.1f}% {deltas[1]:>+11.1f}%")
+    
+    throughput_delta = (current["images_per_sec"] / baseline["images_per_sec"] - 1) * 100
+    print("-"*60)
+    print(f"Throughput: {throughput_delta:+.1f}%")
+    print("="*60)
+    return regressions
+
+
+# ==================== RESOLUTION BENCHMARK ====================
+
+def run_resolution_benchmark(
+    image_paths: List[str],
+    sizes: List[Optional[int]],
+    use_yolo: bool,
+    repeat: int
+) -> Dict:
+    """
+    Compare speed and classification agreement across analysis resolutions.
+
+    The first entry of sizes is the reference; agreement is the share of
+    (image, category) statuses that match the reference run.
+
+    Returns:
+        Machine-readable benchmark results
+    """
+    runs = []
+    reference = None
+
+    for size in sizes:
+        system = CompleteCivicIssueDetectionSystem(use_yolo=use_yolo, analysis_size=size)
+        latencies = []
+        results = {}
+
+        for _ in range(repeat):
+            for path in image_paths:
+                start = time.perf_counter()
+                results[path] = system.process_image(path, verbose=False)
+                latencies.append(time.perf_counter() - start)
+
+        if reference is None:
+            reference = results
+
+        per_category = {}
+        for category in CATEGORIES:
+            matches = sum(
+                results[path][category] == reference[path][category]
+                for path in image_paths
+            )
+            per_category[category] = matches / len(image_paths)
+
+        total = sum(latencies)
+        runs.append({
+            "analysis_size": size,
+            "images": len(latencies),
+            "mean_ms": total / len(latencies) * 1000,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "images_per_sec": len(latencies) / total if total else 0.0,
+            "agreement": sum(per_category.values()) / len(CATEGORIES),
+            "agreement_by_category": per_category
+        })
+
+    return {
+        "benchmark": "resolution",
+        "model_type": system.vision_model.model_type,
+        "image_count": len(image_paths),
+        "repeat": repeat,
+        "runs": runs
+    }
+
+
+def print_resolution_table(report: Dict):
+    print("\n" + "ANALYSIS RESOLUTION BENCHMARK".center(60))
+    print("="*60)
+    print(f"Model: {report['model_type']}   Images: {report['image_count']} x {report['repeat']}")
+    print("-"*60)
+    print(f"{'size':>8} {'mean ms':>10} {'p95 ms':>10} {'img/s':>10} {'agreement':>12}")
+    for run in report["runs"]:
+        size = run["analysis_size"] or "full"
+        print(f"{size:>8} {run['mean_ms']:>10.2f} {run['p95_ms']:>10.2f} "
+              f"{run['images_per_sec']:>10.1f} {run['agreement']:>11.1%}")
+    print("="*60)
+
+
+# ==================== CATEGORY SELECTION BENCHMARK ====================
+
+def run_category_benchmark(
+    image_paths: List[str],
+    system: CompleteCivicIssueDetectionSystem,
+    repeat: int = 3
+) -> Dict:
+    """
+    Time classify_all_issues for all categories against each one alone.
+    
+    Detection runs once per image up front, and every pass starts from a
+    fresh ImageFeatures, so the timings cover colour conversion, bucketing
+    and the classifiers. mismatches counts single-category results that
+    differ from the same category in the all-categories run.
+    
+    Returns:
+        Machine-readable benchmark results
+    """
+    vision_model = system.vision_model
+    classifier = system.classifier
+    detected = []
+    for path in image_paths:
+        img, original_size = vision_model.read_image(path)
+        detected.append((img, vision_model.detect(img, original_size=original_size)))
+    
+    selections = [None] + [[name] for name in classifier.CATEGORIES]
+    runs = []
+    reference = None
+    for categories in selections:
+        latencies = []
+        results = []
+        for _ in range(repeat):
+            results = []
+            for img, analysis in detected:
+                start = time.perf_counter()
+                results.append(classifier.classify_all_issues(analysis, img, ImageFeatures(img), categories))
+                latencies.append(time.perf_counter() - start)
+        if reference is None:
+            reference = results
+        mismatches = sum(
+            result[name] != full[name]
+            for result, full in zip(results, reference) for name in result
+        )
+        runs.append({
+            "categories": categories or "all",
+            "latency": latency_summary(latencies),
+            "mismatches": mismatches
+        })
+    
+    return {
+        "benchmark": "categories",
+        "environment": environment_info(),
+        "model_type": vision_model.model_type,
+        "image_count": len(image_paths),
+        "repeat": repeat,
+        "runs": runs
+    }
+
+
+def print_category_table(report: Dict):
+    print("\n" + "CATEGORY SELECTION BENCHMARK".center(60))
+    print("="*60)
+    print(f"Model: {report['model_type']}   Images: {report['image_count']} x {report['repeat']}")
+    print("-"*60)
+    all_mean = report["runs"][0]["latency"]["mean_ms"]
+    print(f"{'categories':<16} {'mean ms':>9} {'p95 ms':>9} {'vs all':>8} {'mismatches':>12}")
+    for run in report["runs"]:
+        name = run["categories"] if run["categories"] == "all" else ",".join(run["categories"])
+        mean = run["latency"]["mean_ms"]
+        print(f"{name:<16} {mean:>9.3f} {run['latency']['p95_ms']:>9.3f} "
+              f"{mean / all_mean if all_mean else 0.0:>7.0%} {run['mismatches']:>12}")
+    print("="*60)
+
+
+# ==================== WORKER MEMORY BENCHMARK ====================
+
+def process_memory_mb(pid: int) -> Optional[Dict]:
+    """
+    RSS, PSS and USS of a process from /proc/<pid>/smaps_rollup.
+    
+    RSS counts shared pages in full for every process mapping them, PSS
+    splits them between those processes and USS counts only private pages,
+    so USS is what each extra worker really costs. None off Linux.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return {
+        "rss_mb": fields.get("Rss", 0.0),
+        "pss_mb": fields.get("Pss", 0.0),
+        "uss_mb": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0)
+    }
+
+
+def run_worker_memory_benchmark(image_paths: List[str], use_yolo: bool, workers: int) -> Dict:
+    """
+    Per-worker memory with and without copy-on-write model sharing.
+    
+    Each mode runs process_batch_parallel over the images once so every
+    worker has built its system and run detection, then reads the memory
+    of every worker process. "own copy" spawns workers that load the model
+    themselves; "shared" forks them from the process that already loaded it.
+    Mock and YOLO models are shared; ONNX workers spawn either way.
+    
+    Returns:
+        Machine-readable benchmark results
+    """
+    runs = []
+    for mode, share_models in (("own copy", False), ("shared", True)):
+        system = CompleteCivicIssueDetectionSystem(
+            use_yolo=use_yolo, workers=workers,
+            chunk_size=max(1, len(image_paths) // (workers * 2)), share_models=share_models
+        )
+        with system:
+            start = time.perf_counter()
+            results = system.process_batch_parallel(image_paths)
+            elapsed = time.perf_counter() - start
+            # The pool does not expose its workers; this is the executor's own table
+            memory = [process_memory_mb(pid) for pid in system._pool._processes]
+        memory = [entry for entry in memory if entry is not None]
+        
+        runs.append({
+            "mode": mode,
+            "workers": workers,
+            "elapsed_s": elapsed,
+            "errors": sum("error" in result for result in results),
+            "per_worker": memory,
+            **{
+                f"mean_{name}": sum(entry[name] for entry in memory) / len(memory) if memory else None
+                for name in ("rss_mb", "pss_mb", "uss_mb")
+            }
+        })
+    
+    return {
+        "benchmark": "workers",
+        "environment": environment_info(),
+        "model_type": "yolo" if use_yolo else "mock",
+        "image_count": len(image_paths),
+        "parent": process_memory_mb(os.getpid()),
+        "runs": runs
+    }
+
+
+def print_worker_memory_table(report: Dict):
+    print("\n" + "PER-WORKER MEMORY".center(60))
+    print("="*60)
+    print(f"Model: {report['model_type']}   Images: {report['image_count']}")
+    print("-"*60)
+    if report["runs"][0]["mean_rss_mb"] is None:
+        print("Per-process memory needs /proc/<pid>/smaps_rollup (Linux)")
+    else:
+        print(f"{'mode':<10} {'workers':>8} {'RSS MB':>9} {'PSS MB':>9} {'USS MB':>9} {'time s':>9}")
+        for run in report["runs"]:
+            print(f"{run['mode']:<10} {run['workers']:>8} {run['mean_rss_mb']:>9.1f} "
+                  f"{run['mean_pss_mb']:>9.1f} {run['mean_uss_mb']:>9.1f} {run['elapsed_s']:>9.2f}")
+    print("="*60)
+
+
+# ==================== VIDEO BENCHMARK ====================
+
+def run_video_benchmark(
+    video_path: str,
+    system: CompleteCivicIssueDetectionSystem,
+    sample_fps: float,
+    scene_threshold: float
+) -> Dict:
+    """
+    Time process_video and compare its issue events with per-frame issues.
+
+    Returns:
+        Machine-readable benchmark results
+    """
+    capture = cv2.VideoCapture(video_path)
+    native_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+
+    start = time.perf_counter()
+    report = system.process_video(video_path, sample_fps=sample_fps, scene_threshold=scene_threshold)
+    elapsed = time.perf_counter() - start
+
+    duration = frame_count / native_fps if native_fps else 0.0
+    issues = report.pop("issues")
+    return {
+        "benchmark": "video",
+        "environment": environment_info(),
+        "video_path": video_path,
+        "model_type": system.vision_model.model_type,
+        "native_fps": native_fps,
+        "duration_s": duration,
+        "sample_fps": sample_fps,
+        "scene_threshold": scene_threshold,
+        **report,
+        "elapsed_s": elapsed,
+        "realtime_factor": duration / elapsed if elapsed else 0.0,
+        "frame_issue_hits": sum(event["frames"] for event in issues),
+        "issue_events": len(issues),
+        "events": issues
+    }
+
+
+def print_video_table(report: Dict):
+    print("\n" + "VIDEO INGESTION BENCHMARK".center(60))
+    print("="*60)
+    print(f"Video: {report['video_path']}   Model: {report['model_type']}")
+    print(f"Duration: {report['duration_s']:.1f}s at {report['native_fps']:.1f} fps, "
+          f"sampled at {report['sample_fps']:.1f} fps")
+    print("-"*60)
+    print(f"Frames read:      {report['frames_read']}")
+    print(f"Frames sampled:   {report['frames_sampled']}")
+    print(f"Static skipped:   {report['frames_static']}")
+    print(f"Frames analysed:  {report['frames_analyzed']}")
+    print(f"Elapsed:          {report['elapsed_s']:.2f}s ({report['realtime_factor']:.1f}x realtime)")
+    print(f"Issue frames:     {report['frame_issue_hits']} -> {report['issue_events']} issue events")
+    for event in report["events"]:
+        print(f"   {event['start_time']:>7.2f}s - {event['end_time']:>7.2f}s  {event['category']:<14} "
+              f"{event['frames']} frames")
+    print("="*60)
+
+
+# ==================== STARTUP BENCHMARK ====================
+
+HEAVY_MODULES = ("ultralytics", "torch", "supabase")
+
+STARTUP_PROBE = (
+    "import json, sys, time; start = time.perf_counter(); import classifier; "
+    "elapsed = time.perf_counter() - start; "
+    "print(json.dumps({'import_seconds': elapsed, "
+    "'heavy_modules': sorted(name for name in %r if name in sys.modules)}))"
+) % (HEAVY_MODULES,)
+
+
+def run_startup_benchmark(repeat: int = 10) -> Dict:
+    """
+    Time `import classifier` in fresh interpreters.
+    
+    Each run is a new process so nothing is already cached in sys.modules.
+    Wall time includes interpreter startup; import time is measured in-process.
+    
+    Args:
+        repeat: Number of interpreter launches
+        
+    Returns:
+        Report with wall and import latency summaries and any heavy modules loaded
+    """
+    wall_times = []
+    import_times = []
+    heavy_modules = set()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE],
+            cwd=str(Path(__file__).resolve().parent),
+            capture_output=True, text=True, check=True
+        )
+        wall_times.append(time.perf_counter() - start)
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        import_times.append(probe["import_seconds"])
+        heavy_modules.update(probe["heavy_modules"])
+    
+    return {
+        "environment": environment_info(),
+        "repeat": repeat,
+        "wall": latency_summary(wall_times),
+        "import": latency_summary(import_times),
+        "heavy_modules": sorted(heavy_modules),
+    }
+
+
+def print_startup_table(report: Dict):
+    print(f"{'measure':<10} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for measure in ("wall", "import"):
+        summary = report[measure]
+        print(f"{measure:<10} {summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['max_ms']:>9.1f}")
+    print(f"heavy modules loaded at import: {', '.join(report['heavy_modules']) or 'none'}")
+
+
+# ==================== SERVER BENCHMARK ====================
+
+COLD_PROBE = (
+    "import sys; from classifier import CompleteCivicIssueDetectionSystem; "
+    "CompleteCivicIssueDetectionSystem(model_type=sys.argv[1]).process_image(sys.argv[2], verbose=False)"
+)
+
+
+async def post_classify(host: str, port: int, image_path: str) -> Dict:
+    """POST one image path to a running InferenceServer"""
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps({"path": image_path}).encode()
+    writer.write(
+        f"POST /classify HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    if status != 200:
+        raise RuntimeError(f"{image_path}: HTTP {status} {body[:200]!r}")
+    return json.loads(body)
+
+
+async def _load_server(server: InferenceServer, image_paths: List[str],
+                       requests: int, concurrency: int) -> Tuple[List[float], float]:
+    host, port = await server.start()
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    
+    async def one(image_path: str):
+        async with slots:
+            start = time.perf_counter()
+            await post_classify(host, port, image_path)
+            latencies.append(time.perf_counter() - start)
+    
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(image_paths[i % len(image_paths)]) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await server.stop()
+    return latencies, elapsed
+
+
+def run_server_benchmark(
+    image_paths: List[str],
+    model_type: str,
+    requests: int,
+    concurrency: int,
+    max_batch_sizes: List[int],
+    max_wait: float,
+    cold_runs: int
+) -> Dict:
+    """
+    Compare request latency through InferenceServer with cold per-script runs.
+    
+    Cold runs start a fresh interpreter per image, the way one-off scripts
+    do, so they pay for imports and model loading every time. Server runs
+    send requests from concurrency clients at once to a warm server, once
+    per micro-batch size (1 disables batching).
+    
+    Returns:
+        Machine-readable benchmark results
+    """
+    cold = []
+    for i in range(cold_runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", COLD_PROBE, model_type, str(Path(image_paths[i % len(image_paths)]).resolve())],
+            cwd=str(Path(__file__).resolve().parent),
+            capture_output=True, check=True
+        )
+        cold.append(time.perf_counter() - start)
+    
+    runs = []
+    for max_batch_size in max_batch_sizes:
+        server = InferenceServer(
+            CompleteCivicIssueDetectionSystem(model_type=model_type),
+            port=0, max_batch_size=max_batch_size, max_wait=max_wait
+        )
+        latencies, elapsed = asyncio.run(_load_server(server, image_paths, requests, concurrency))
+        stats = server.stats()
+        runs.append({
+            "max_batch_size": max_batch_size,
+            "latency": latency_summary(latencies),
+            "requests_per_second": requests / elapsed,
+            "mean_batch_size": stats["mean_batch_size"],
+        })
+    
+    return {
+        "environment": environment_info(),
+        "model_type": model_type,
+        "requests": requests,
+        "concurrency": concurrency,
+        "max_wait_ms": max_wait * 1000,
+        "cold": latency_summary(cold),
+        "runs": runs,
+    }
+
+
+def print_server_table(report: Dict):
+    print(f"{'mode':<14} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'batch':>6}")
+    cold = report["cold"]
+    print(f"{'cold script':<14} {cold['p50_ms']:>9.1f} {cold['p95_ms']:>9.1f} {cold['p99_ms']:>9.1f} "
+          f"{'':>8} {'':>6}")
+    for run in report["runs"]:
+        latency = run["latency"]
+        print(f"{'server b=' + str(run['max_batch_size']):<14} {latency['p50_ms']:>9.1f} "
+              f"{latency['p95_ms']:>9.1f} {latency['p99_ms']:>9.1f} "
+              f"{run['requests_per_second']:>8.1f} {run['mean_batch_size']:>6.2f}")
+
+
+# ==================== SPOOL BENCHMARK ====================
+
+def run_spool_benchmark(
+    count: int,
+    fail_rate: float,
+    outage: Tuple[float, float],
+    poison: int,
+    chunk_size: int,
+    rows_per_second: Optional[float],
+    timeout: float,
+    seed: int = 0,
+    ack_loss_rate: float = 0.0
+) -> Dict:
+    """
+    Spool synthetic results and drain them into a randomly failing stand-in.
+    
+    Measures how fast ingestion can hand rows to the spool, how the queue
+    depth evolves while the drainer fights failures and an outage, and
+    whether every deliverable row arrived exactly once.
+    
+    Returns:
+        Machine-readable benchmark results
+    """
+    # The stand-in lives with the tests; it is the same table they check against
+    from conftest import FlakySupabaseClient, synthetic_results
+    
+    client = FlakySupabaseClient(fail_rate, outage, seed=seed, ack_loss_rate=ack_loss_rate)
+    connector = SupabaseConnector("", "", client=client)
+    results = synthetic_results(count, poison, seed)
+    
+    with tempfile.TemporaryDirectory() as directory, UploadSpool(str(Path(directory) / "spool.sqlite")) as spool:
+        start = time.perf_counter()
+        summary = connector.spool_batch(results, spool)
+        enqueue_seconds = time.perf_counter() - start
+        
+        drainer = SpoolDrainer(
+            spool, connector, chunk_size=chunk_size, rows_per_second=rows_per_second,
+            backoff=0.05, max_backoff=1.0, failure_threshold=3, reset_timeout=0.5
+        )
+        depths = []
+        start = time.perf_counter()
+        drainer.start()
+        drained = drainer.wait_until_empty(
+            timeout, report=lambda stats: depths.append(stats["depth"]), report_interval=0.1
+        )
+        drain_seconds = time.perf_counter() - start
+        drainer.stop()
+        stats = drainer.stats()
+    
+    keys = Counter((row["image_url"], row["title"]) for row in client.rows)
+    poisoned_rows = sum(
+        1 for result in results[:poison] for category, issue_status in issue_statuses().items()
+        if result[category]["status"] == issue_status
+    )
+    return {
+        "environment": environment_info(),
+        "rows": summary["spooled"],
+        "enqueue_rows_per_second": summary["spooled"] / max(enqueue_seconds, 1e-9),
+        "drained": drained,
+        "drain_seconds": drain_seconds,
+        "max_depth": max(depths, default=stats["depth"]),
+        "requests": client.requests,
+        "failed_requests": client.failures,
+        "lost_acks": client.lost_acks,
+        "delivered": len(keys),
+        "duplicates": sum(keys.values()) - len(keys),
+        "lost": summary["spooled"] - poisoned_rows - len(keys) - stats["depth"],
+        "dead": stats["dead"],
+        "expected_dead": poisoned_rows,
+    }
+
+
+def print_spool_table(report: Dict):
+    print(f"spooled {report['rows']} rows at {report['enqueue_rows_per_second']:.0f} rows/s")
+    print(f"drained: {report['drained']} in {report['drain_seconds']:.2f}s "
+          f"(max depth {report['max_depth']})")
+    print(f"requests: {report['requests']} ({report['failed_requests']} failed, "
+          f"{report['lost_acks']} after storing)")
+    print(f"delivered {report['delivered']}, duplicates {report['duplicates']}, lost {report['lost']}, "
+          f"dead-lettered {report['dead']} (expected {report['expected_dead']})")
+
+
+# ==================== BACKEND BENCHMARK ====================
+
+BACKENDS = {
+    "yolo": {"model_type": "yolo"},
+    "onnx": {"model_type": "onnx"},
+    "onnx-int8": {"model_type": "onnx", "quantize": True},
+    "mock": {"model_type": "mock"},
+}
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of x, y, w, h boxes"""
+    a_min, a_max = a[:, None, :2], a[:, None, :2] + a[:, None, 2:]
+    b_min, b_max = b[None, :, :2], b[None, :, :2] + b[None, :, 2:]
+    inter = np.clip(np.minimum(a_max, b_max) - np.maximum(a_min, b_min), 0, None).prod(axis=2)
+    union = a[:, None, 2:].prod(axis=2) + b[None, :, 2:].prod(axis=2) - inter
+    # Degenerate (zero-area) boxes only match themselves
+    identical = (a[:, None, :] == b[None, :, :]).all(axis=2)
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), identical.astype(np.float64))
+
+
+def match_detections(reference, candidate, iou_threshold: float = 0.5) -> int:
+    """Greedy one-to-one matches with the same label and IoU above the threshold"""
+    ref_boxes = np.array([obj.bbox for obj in reference], dtype=np.float64).reshape(-1, 4)
+    cand_boxes = np.array([obj.bbox for obj in candidate], dtype=np.float64).reshape(-1, 4)
+    if not len(ref_boxes) or not len(cand_boxes):
+        return 0
+
+    iou = box_iou(ref_boxes, cand_boxes)
+    same_label = np.array([[r.label == c.label for c in candidate] for r in reference])
+    iou[~same_label] = 0.0
+
+    matched = 0
+    while True:
+        best = np.unravel_index(iou.argmax(), iou.shape)
+        if iou[best] < iou_threshold:
+            return matched
+        matched += 1
+        iou[best[0], :] = 0.0
+        iou[:, best[1]] = 0.0
+
+
+def run_backend_benchmark(
+    image_paths: List[str],
+    backends: List[str],
+    repeat: int,
+    intra_op_threads: Optional[int] = None,
+    inter_op_threads: Optional[int] = None
+) -> Dict:
+    """
+    Compare detection backends on the same decoded images.
+
+    The first backend is the reference. For every other backend, recall is
+    the share of reference detections it reproduces (same label, IoU >= 0.5),
+    precision the share of its own detections that match one, and agreement
+    the share of (image, category) statuses that match.
+
+    Returns:
+        Machine-readable benchmark results
+    """
+    runs = []
+    reference = None
+
+    for name in backends:
+        system = CompleteCivicIssueDetectionSystem(
+            intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads, **BACKENDS[name]
+        )
+        vision = system.vision_model
+        images = {path: vision.read_image(path) for path in image_paths}
+
+        latencies = []
+        analyses = {}
+        for _ in range(repeat):
+            for path in image_paths:
+                img, original_size = images[path]
+                start = time.perf_counter()
+                analyses[path] = vision.detect(img, original_size=original_size)
+                latencies.append(time.perf_counter() - start)
+
+        results = {
+            path: system.classifier.classify_all_issues(analyses[path], images[path][0])
+            for path in image_paths
+        }
+        detections = {path: list(analyses[path].detected_objects) for path in image_paths}
+        if reference is None:
+            reference = (detections, results)
+
+        ref_detections, ref_results = reference
+        matched = sum(match_detections(ref_detections[path], detections[path]) for path in image_paths)
+        ref_total = sum(len(objects) for objects in ref_detections.values())
+        own_total = sum(len(objects) for objects in detections.values())
+        agreement = sum(
+            results[path][category] == ref_results[path][category]
+            for path in image_paths for category in CATEGORIES
+        ) / (len(image_paths) * len(CATEGORIES))
+
+        runs.append({
+            "backend": name,
+            "model_type": vision.model_type,
+            "weights": vision.weights,
+            "latency": latency_summary(latencies),
+            "detections": own_total,
+            "recall": matched / ref_total if ref_total else 1.0,
+            "precision": matched / own_total if own_total else 1.0,
+            "agreement": agreement
+        })
+
+    return {
+        "benchmark": "backends",
+        "environment": environment_info(),
+        "image_count": len(image_paths),
+        "repeat": repeat,
+        "intra_op_threads": intra_op_threads,
+        "inter_op_threads": inter_op_threads,
+        "runs": runs
+    }
+
+
+def print_backend_table(report: Dict):
+    print("\n" + "DETECTION BACKEND BENCHMARK".center(60))
+    print("="*60)
+    print(f"Images: {report['image_count']} x {report['repeat']}   Reference: {report['runs'][0]['backend']}")
+    print("-"*60)
+    print(f"{'backend':<10} {'p50 ms':>8} {'p95 ms':>8} {'recall':>8} {'precision':>10} {'agreement':>10}")
+    for run in report["runs"]:
+        print(f"{run['backend']:<10} {run['latency']['p50_ms']:>8.2f} {run['latency']['p95_ms']:>8.2f} "
+              f"{run['recall']:>8.1%} {run['precision']:>10.1%} {run['agreement']:>10.1%}")
+    print("="*60)
+
+
+def parse_sizes(value: str) -> List[Optional[int]]:
+    """Parse "0,1280,640" into [None, 1280, 640]; 0 means full resolution"""
+    return [int(part) or None for part in value.split(",") if part.strip()]
+
+
+def parse_resolutions(value: str) -> Tuple[Tuple[int, int], ...]:
+    """Parse "640x480,1920x1080" into ((640, 480), (1920, 1080))"""
+    return tuple(
+        tuple(int(side) for side in part.lower().split("x"))
+        for part in value.split(",") if part.strip()
+    )
+
+
+def write_report(report: Dict, output: Optional[str]):
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to: {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Civic issue detection benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    stages = subparsers.add_parser(
+        "stages", help="per-stage latency percentiles on synthetic civic images"
+    )
+    stages.add_argument("--images", default=None,
+                        help="benchmark these images instead of synthetic ones")
+    stages.add_argument("--synthetic-dir", default="bench_images",
+                        help="where synthetic images are written (default: bench_images)")
+    stages.add_argument("--resolutions", type=parse_resolutions,
+                        default=DEFAULT_RESOLUTIONS,
+                        help="comma-separated WxH list for synthetic images")
+    stages.add_argument("--per-resolution", type=int, default=10,
+                        help="synthetic images per resolution (default: 10)")
+    stages.add_argument("--seed", type=int, default=0, help="synthetic scene seed")
+    stages.add_argument("--analysis-size", type=int, default=None,
+                        help="long edge to analyse at (default: full resolution)")
+    stages.add_argument("--mock", action="store_true", help="use the mock detector")
+    stages.add_argument("--repeat", type=int, default=3, help="passes over the image set")
+    stages.add_argument("--output", default=None, help="write results JSON to this path")
+    
+    compare = subparsers.add_parser("compare", help="compare two stage result files")
+    compare.add_argument("baseline", help="earlier results JSON")
+    compare.add_argument("current", help="new results JSON")
+    compare.add_argument("--threshold", type=float, default=10.0,
+                         help="percent slowdown that counts as a regression (default: 10)")
+
+    resolution = subparsers.add_parser(
+        "resolution", help="speed and classification agreement across analysis resolutions"
+    )
+    resolution.add_argument("--images", default=DEFAULT_IMAGE_DIR,
+                            help=f"directory of images (default: {DEFAULT_IMAGE_DIR})")
+    resolution.add_argument("--sizes", type=parse_sizes, default=parse_sizes("0,1280,960,640,480,320"),
+                            help="comma-separated long edges; 0 = full resolution, used as reference")
+    resolution.add_argument("--mock", action="store_true", help="use the mock detector")
+    resolution.add_argument("--repeat", type=int, default=3, help="passes over the image set")
+    resolution.add_argument("--output", default=None, help="write results JSON to this path")
+
+    backends = subparsers.add_parser(
+        "backends", help="latency and detection parity across detection backends"
+    )
+    backends.add_argument("--images", default=DEFAULT_IMAGE_DIR,
+                          help=f"directory of images (default: {DEFAULT_IMAGE_DIR})")
+    backends.add_argument("--backends", default="yolo,onnx,onnx-int8",
+                          help="comma-separated backends, first is the reference "
+                               f"(choices: {', '.join(BACKENDS)})")
+    backends.add_argument("--intra-op-threads", type=int, default=None,
+                          help="ONNX Runtime threads per operator")
+    backends.add_argument("--inter-op-threads", type=int, default=None,
+                          help="ONNX Runtime threads across operators")
+    backends.add_argument("--min-recall", type=float, default=None,
+                          help="fail if any backend reproduces less than this share of reference boxes")
+    backends.add_argument("--repeat", type=int, default=3, help="passes over the image set")
+    backends.add_argument("--output", default=None, help="write results JSON to this path")
+
+    categories = subparsers.add_parser(
+        "categories", help="classification cost of each category alone against all of them"
+    )
+    categories.add_argument("--images", default=None,
+                            help="benchmark these images instead of synthetic ones")
+    categories.add_argument("--synthetic-dir", default="bench_images",
+                            help="where synthetic images are written (default: bench_images)")
+    categories.add_argument("--resolutions", type=parse_resolutions,
+                            default=DEFAULT_RESOLUTIONS,
+                            help="comma-separated WxH list for synthetic images")
+    categories.add_argument("--per-resolution", type=int, default=5,
+                            help="synthetic images per resolution (default: 5)")
+    categories.add_argument("--mock", action="store_true", help="use the mock detector")
+    categories.add_argument("--repeat", type=int, default=3, help="passes over the image set")
+    categories.add_argument("--output", default=None, help="write results JSON to this path")
+
+    workers = subparsers.add_parser(
+        "workers", help="per-worker memory with and without copy-on-write model sharing"
+    )
+    workers.add_argument("--images", default=DEFAULT_IMAGE_DIR,
+                         help=f"directory of images (default: {DEFAULT_IMAGE_DIR})")
+    workers.add_argument("--workers", type=int, default=4, help="worker processes (default: 4)")
+    workers.add_argument("--mock", action="store_true", help="use the mock detector")
+    workers.add_argument("--output", default=None, help="write results JSON to this path")
+
+    video = subparsers.add_parser("video", help="sampled video ingestion and issue aggregation")
+    video.add_argument("--video", default=None,
+                       help="video to process (default: a synthetic clip under --synthetic-dir)")
+    video.add_argument("--synthetic-dir", default="bench_images",
+                       help="where the synthetic clip is written (default: bench_images)")
+    video.add_argument("--sample-fps", type=float, default=2.0, help="frames per second to analyse")
+    video.add_argument("--scene-threshold", type=float, default=4.0,
+                       help="minimum frame change (0-255) to analyse a sampled frame")
+    video.add_argument("--mock", action="store_true", help="use the mock detector")
+    video.add_argument("--output", default=None, help="write results JSON to this path")
+
+    startup = subparsers.add_parser("startup", help="time `import classifier` in fresh interpreters")
+    startup.add_argument("--repeat", type=int, default=10, help="interpreter launches (default: 10)")
+    startup.add_argument("--max-import-ms", type=float, default=None,
+                         help="fail if the median import time exceeds this many milliseconds")
+    startup.add_argument("--output", default=None, help="write results JSON to this path")
+
+    server = subparsers.add_parser(
+        "server", help="warm inference server latency against cold per-script runs"
+    )
+    server.add_argument("--images", default=DEFAULT_IMAGE_DIR,
+                        help=f"directory of images (default: {DEFAULT_IMAGE_DIR})")
+    server.add_argument("--requests", type=int, default=200, help="requests per server run (default: 200)")
+    server.add_argument("--concurrency", type=int, default=16,
+                        help="requests in flight at once (default: 16)")
+    server.add_argument("--max-batch-sizes", type=parse_sizes, default=parse_sizes("1,8"),
+                        help="comma-separated micro-batch sizes to run (default: 1,8)")
+    server.add_argument("--max-wait-ms", type=float, default=10.0,
+                        help="longest a micro-batch waits to fill up (default: 10)")
+    server.add_argument("--cold-runs", type=int, default=5,
+                        help="fresh-interpreter runs for the cold baseline (default: 5)")
+    server.add_argument("--mock", action="store_true", help="use the mock detector")
+    server.add_argument("--output", default=None, help="write results JSON to this path")
+
+    spool = subparsers.add_parser(
+        "spool", help="drain the upload spool into a randomly failing Supabase stand-in"
+    )
+    spool.add_argument("--results", type=int, default=2000, help="synthetic results (default: 2000)")
+    spool.add_argument("--fail-rate", type=float, default=0.2,
+                       help="probability any request fails (default: 0.2)")
+    spool.add_argument("--outage", default="0.5,2.0", metavar="START,END",
+                       help="seconds after start during which every request fails (default: 0.5,2.0)")
+    spool.add_argument("--ack-loss-rate", type=float, default=0.05,
+                       help="probability a request is stored but its response is lost (default: 0.05)")
+    spool.add_argument("--poison", type=int, default=3,
+                       help="results whose rows are always rejected (default: 3)")
+    spool.add_argument("--chunk-size", type=int, default=100, help="rows per request (default: 100)")
+    spool.add_argument("--rows-per-second", type=float, default=None, help="drainer rate limit")
+    spool.add_argument("--timeout", type=float, default=120.0, help="longest drain, in seconds")
+    spool.add_argument("--output", default=None, help="write results JSON to this path")
+
+    args = parser.parse_args()
+    
+    if args.command == "spool":
+        outage = tuple(float(part) for part in args.outage.split(","))
+        if len(outage) != 2:
+            parser.error("--outage must be START,END")
+        report = run_spool_benchmark(
+            args.results, args.fail_rate, outage, args.poison,
+            args.chunk_size, args.rows_per_second, args.timeout, ack_loss_rate=args.ack_loss_rate
+        )
+        print_spool_table(report)
+        write_report(report, args.output)
+        if not report["drained"] or report["lost"] or report["duplicates"] or report["dead"] != report["expected_dead"]:
+            print("Spool did not deliver every row exactly once")
+            sys.exit(1)
+        return
+    
+    if args.command == "server":
+        image_paths = find_images(args.images)
+        if not image_paths:
+            parser.error(f"no images found under {args.images}")
+        if not all(args.max_batch_sizes):
+            parser.error("--max-batch-sizes must all be at least 1")
+        
+        report = run_server_benchmark(
+            image_paths,
+            "yolo" if YOLO_AVAILABLE and not args.mock else "mock",
+            args.requests, args.concurrency, args.max_batch_sizes,
+            args.max_wait_ms / 1000, args.cold_runs
+        )
+        print_server_table(report)
+        write_report(report, args.output)
+        return
+    
+    if args.command == "backends":
+        names = [name.strip() for name in args.backends.split(",") if name.strip()]
+        unknown = [name for name in names if name not in BACKENDS]
+        if unknown:
+            parser.error(f"unknown backends: {', '.join(unknown)}")
+        image_paths = find_images(args.images)
+        if not image_paths:
+            parser.error(f"no images found under {args.images}")
+
+        report = run_backend_benchmark(
+            image_paths, names, args.repeat, args.intra_op_threads, args.inter_op_threads
+        )
+        print_backend_table(report)
+        write_report(report, args.output)
+        if args.min_recall is not None:
+            below = [run["backend"] for run in report["runs"] if run["recall"] < args.min_recall]
+            if below:
+                print(f"Recall below {args.min_recall:.0%}: {', '.join(below)}")
+                sys.exit(1)
+        return
+
+    if args.command == "video":
+        if args.video:
+            video_path = args.video
+        else:
+            from conftest import write_synthetic_video
+            video_path = write_synthetic_video(
+                str(Path(args.synthetic_dir) / "synthetic_dashcam.mp4"), scene=synthetic_civic_image
+            )
+        system = CompleteCivicIssueDetectionSystem(use_yolo=YOLO_AVAILABLE and not args.mock)
+        report = run_video_benchmark(video_path, system, args.sample_fps, args.scene_threshold)
+        print_video_table(report)
+        write_report(report, args.output)
+        return
+
+    if args.command == "startup":
+        report = run_startup_benchmark(repeat=args.repeat)
+        print_startup_table(report)
+        write_report(report, args.output)
+        problems = []
+        if report["heavy_modules"]:
+            problems.append(f"heavy modules imported eagerly: {', '.join(report['heavy_modules'])}")
+        if args.max_import_ms is not None and report["import"]["p50_ms"] > args.max_import_ms:
+            problems.append(
+                f"median import {report['import']['p50_ms']:.1f} ms exceeds {args.max_import_ms:.1f} ms"
+            )
+        if problems:
+            print("Regressions:")
+            for problem in problems:
+                print(f"   - {problem}")
+            sys.exit(1)
+        return
+    
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare_reports(baseline, current, args.threshold)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        return
+    
+    if args.command == "workers":
+        image_paths = find_images(args.images)
+        if not image_paths:
+            parser.error(f"no images found under {args.images}")
+        
+        report = run_worker_memory_benchmark(
+            image_paths, YOLO_AVAILABLE and not args.mock, args.workers
+        )
+        print_worker_memory_table(report)
+        write_report(report, args.output)
+        return
+    
+    if args.command == "categories":
+        if args.images:
+            image_paths = find_images(args.images)
+        else:
+            image_paths = generate_synthetic_images(
+                args.synthetic_dir, args.resolutions, args.per_resolution
+            )
+        if not image_paths:
+            parser.error("no images to benchmark")
+        
+        system = CompleteCivicIssueDetectionSystem(use_yolo=YOLO_AVAILABLE and not args.mock)
+        report = run_category_benchmark(image_paths, system, repeat=args.repeat)
+        print_category_table(report)
+        write_report(report, args.output)
+        if any(run["mismatches"] for run in report["runs"]):
+            print("Single-category results differ from the all-categories run")
+            sys.exit(1)
+        return
+    
+    if args.command == "stages":
+        if args.images:
+            image_paths = find_images(args.images)
+        else:
+            image_paths = generate_synthetic_images(
+                args.synthetic_dir, args.resolutions, args.per_resolution, args.seed
+            )
+        if not image_paths:
+            parser.error("no images to benchmark")
+        
+        system = CompleteCivicIssueDetectionSystem(
+            use_yolo=YOLO_AVAILABLE and not args.mock, analysis_size=args.analysis_size
+        )
+        report = run_stage_benchmark(image_paths, system, repeat=args.repeat)
+        print_stage_table(report)
+        write_report(report, args.output)
+        return
+
+    image_paths = find_images(args.images)
+    if not image_paths:
+        parser.error(f"no images found under {args.images}")
+
+    report = run_resolution_benchmark(
+        image_paths, args.sizes, use_yolo=YOLO_AVAILABLE and not args.mock, repeat=args.repeat
+    )
+    print_resolution_table(report)
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytest
+
+from classifier import issue_statuses
+
+
+# ==================== SUPABASE STAND-IN ====================
+
+class StandInAPIError(Exception):
+    """Row rejection shaped like a PostgREST APIError (SQLSTATE in `code`)"""
+
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+
+class FlakySupabaseClient:
+    """
+    Local stand-in for the Supabase client whose requests fail at random.
+
+    Every request fails with a ConnectionError with probability fail_rate
+    and throughout the outage window (seconds after creation). With
+    probability ack_loss_rate a request is stored and then fails with a
+    TimeoutError, like a response lost after the server committed. Any
+    request containing a row whose image_url mentions "poison" is rejected
+    with a not-null violation, like a row the real table would never
+    accept. Upserts honour on_conflict and ignore_duplicates and merge the
+    sent columns into an existing row, so `rows` is exactly what a real
+    table would hold. With keyed=False the table predates the issue_key
+    migration, and requests mentioning the column are rejected the way
+    PostgREST rejects an unknown column.
+
+    Requests are built and executed under one lock, so a client is only
+    safe to share between threads that do not interleave table() calls.
+    """
+
+    def __init__(self, fail_rate: float = 0.2, outage: Tuple[float, float] = (0.0, 0.0),
+                 latency: float = 0.002, seed: int = 0, ack_loss_rate: float = 0.0,
+                 keyed: bool = True):
+        self.fail_rate = fail_rate
+        self.outage = outage
+        self.latency = latency
+        self.ack_loss_rate = ack_loss_rate
+        self.keyed = keyed
+        self.rows: List[Dict] = []
+        self.requests = 0
+        self.failures = 0
+        self.lost_acks = 0
+        self._random = random.Random(seed)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._pending: List[Dict] = []
+        self._upsert: Optional[Tuple[str, bool]] = None
+        self._keys: Dict[str, int] = {}
+
+    def table(self, name: str) -> "FlakySupabaseClient":
+        return self
+
+    def insert(self, rows) -> "FlakySupabaseClient":
+        self._pending = rows if isinstance(rows, list) else [rows]
+        self._upsert = None
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id", ignore_duplicates: bool = False) -> "FlakySupabaseClient":
+        self._pending = rows if isinstance(rows, list) else [rows]
+        self._upsert = (on_conflict, ignore_duplicates)
+        return self
+
+    def execute(self):
+        rows, self._pending = self._pending, []
+        upsert, self._upsert = self._upsert, None
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            elapsed = time.monotonic() - self._started
+            if self.outage[0] <= elapsed < self.outage[1] or self._random.random() < self.fail_rate:
+                self.failures += 1
+                raise ConnectionError("stand-in request failed")
+            if not self.keyed and (upsert or any("issue_key" in row for row in rows)):
+                self.failures += 1
+                raise StandInAPIError("Could not find the 'issue_key' column of 'civic_issues'", "PGRST204")
+            if any("poison" in row.get("image_url", "") for row in rows):
+                self.failures += 1
+                raise StandInAPIError('null value in column "title" violates not-null constraint', "23502")
+            self._store(rows, upsert)
+            if self._random.random() < self.ack_loss_rate:
+                self.failures += 1
+                self.lost_acks += 1
+                raise TimeoutError("stand-in response lost after commit")
+        return type("Response", (), {"data": rows})()
+
+    def _store(self, rows: List[Dict], upsert: Optional[Tuple[str, bool]]):
+        if upsert is None:
+            self.rows.extend(dict(row) for row in rows)
+            return
+        column, ignore_duplicates = upsert
+        for row in rows:
+            position = self._keys.get(row[column])
+            if position is None:
+                self._keys[row[column]] = len(self.rows)
+                self.rows.append(dict(row))
+            elif not ignore_duplicates:
+                self.rows[position].update(row)
+
+
+def synthetic_results(count: int, poison: int, seed: int) -> List[Dict]:
+    """Classification results with random issues, the first `poison` of them undeliverable"""
+    rng = random.Random(seed)
+    results = []
+    for i in range(count):
+        name = f"poison_{i}.jpg" if i < poison else f"img_{i}.jpg"
+        # No file behind the path, so the result carries its own content hash
+        result = {"image_path": f"synthetic/Sector {i % 5 + 1}/{name}", "content_hash": f"{seed}-{i}"}
+        for category, issue_status in issue_statuses().items():
+            result[category] = {"status": issue_status if rng.random() < 0.4 else "none"}
+        results.append(result)
+    return results
+
+
+# ==================== SYNTHETIC VIDEO ====================
+
+def street_scene(width: int, height: int, seed: int) -> np.ndarray:
+    """A road with a dark pothole-like blob whose position depends on the seed"""
+    rng = np.random.RandomState(seed)
+    img = np.full((height, width, 3), 170, dtype=np.uint8)
+    img[height//2:, :] = 110
+    center = (int(width * rng.uniform(0.2, 0.8)), int(height * rng.uniform(0.65, 0.85)))
+    cv2.ellipse(img, center, (width // 6, height // 10), 0, 0, 360, (15, 15, 15), -1)
+    return img
+
+
+def write_synthetic_video(
+    path: str,
+    width: int = 640,
+    height: int = 360,
+    fps: int = 15,
+    scenes: int = 4,
+    seconds_per_scene: float = 3.0,
+    still_seconds: float = 2.0,
+    seed: int = 0,
+    scene: Callable[[int, int, int], np.ndarray] = street_scene
+) -> str:
+    """
+    Write a deterministic dashcam-like clip, reusing the file if it exists.
+
+    The camera pans across a strip of scene(width, height, seed) images,
+    then holds still for still_seconds (a vehicle stopped at a light) so
+    scene-change skipping has something to skip.
+
+    Returns:
+        Path of the video
+    """
+    if Path(path).exists():
+        return path
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    strip = np.concatenate([scene(width, height, seed + index) for index in range(scenes)], axis=1)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a video writer for {path}")
+
+    moving = max(2, int(scenes * seconds_per_scene * fps))
+    travel = strip.shape[1] - width
+    try:
+        for index in range(moving):
+            x = round(index * travel / (moving - 1))
+            frame = np.ascontiguousarray(strip[:, x:x + width])
+            writer.write(frame)
+        for _ in range(int(still_seconds * fps)):
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+# ==================== FIXTURES ====================
+
+@pytest.fixture
+def stand_in():
+    """Factory for FlakySupabaseClient stand-ins"""
+    return FlakySupabaseClient
+
+
+@pytest.fixture
+def make_results():
+    """Factory for synthetic classification results"""
+    return synthetic_results
+
+
+@pytest.fixture
+def synthetic_video():
+    """Factory for synthetic dashcam clips"""
+    return write_synthetic_video
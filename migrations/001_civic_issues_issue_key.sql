@@ -0,0 +1,17 @@
+-- Stable identity for uploaded civic issues.
+--
+-- classifier.py stamps every row with issue_key = sha256(locality, title,
+-- image content hash) and uploads with ON CONFLICT (issue_key), so retried
+-- and replayed requests never store an issue twice. Existing rows keep a
+-- NULL key, which the unique index allows any number of.
+--
+-- Until this is applied, bulk and spooled uploads fall back to plain
+-- inserts and --upload-index cannot be used.
+
+alter table civic_issues add column if not exists issue_key text;
+
+create unique index if not exists civic_issues_issue_key_idx
+    on civic_issues (issue_key);
+
+-- Let PostgREST see the new column without a restart
+notify pgrst, 'reload schema';
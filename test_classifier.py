@@ -0,0 +1,1335 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+import benchmark
+import classifier
+from classifier import (
+    METRICS, MOCK_DARK, MOCK_WATER, ONNX_PAD_VALUE, CivicIssuePipeline,
+    CompleteCivicIssueDetectionSystem, DetectedObject, DetectionColumns, DirectoryManifest,
+    EnhancedCivicIssueClassifier, ImageAnalysis, ImageFeatures, InferenceServer, IssueType,
+    MetricsRegistry, ModelRegistry, NDJSONResultWriter, NearDuplicate, NearDuplicateIndex,
+    ProgressLog, ResultCache, SpoolDrainer, SupabaseConnector, TemporalIssueAggregator, Tile,
+    UploadIndex, UploadSpool, analysis_from_dict, analysis_to_dict, decode_yolo_output,
+    format_issues, issue_key, issue_statuses, letterbox, merge_tile_detections, mock_label_map,
+    nms, plan_tiles, prune_deletions, read_ndjson, read_ndjson_at, reduced_decode_flag,
+    result_fingerprint
+)
+
+
+# ==================== UPLOAD SPOOL ====================
+
+def issue_rows(results):
+    """Number of issue rows the stand-in table should end up with per result"""
+    return sum(
+        result[category]["status"] == issue_status
+        for result in results for category, issue_status in issue_statuses().items()
+    )
+
+
+def drain(tmp_path, client, results, timeout=30.0, **options):
+    connector = SupabaseConnector("", "", client=client)
+    with UploadSpool(str(tmp_path / "spool.sqlite")) as spool:
+        summary = connector.spool_batch(results, spool)
+        drainer = SpoolDrainer(
+            spool, connector, backoff=0.01, max_backoff=0.05,
+            failure_threshold=3, reset_timeout=0.05, poll_interval=0.01, **options
+        ).start()
+        drained = drainer.wait_until_empty(timeout)
+        drainer.stop()
+        return summary, drained, drainer.stats()
+
+
+def test_spool_delivers_every_row_once_despite_lost_responses(tmp_path, stand_in, make_results):
+    client = stand_in(fail_rate=0.2, latency=0.0, seed=1, ack_loss_rate=0.2)
+    results = make_results(300, poison=2, seed=1)
+
+    summary, drained, stats = drain(tmp_path, client, results, chunk_size=20)
+
+    assert drained
+    assert client.lost_acks > 0
+    keys = Counter((row["image_url"], row["title"]) for row in client.rows)
+    assert max(keys.values()) == 1
+    assert len(keys) == issue_rows(results[2:])
+    assert stats["dead"] == issue_rows(results[:2])
+    assert summary["spooled"] == issue_rows(results)
+
+
+def test_spool_keeps_rows_through_an_outage(tmp_path, stand_in, make_results):
+    client = stand_in(fail_rate=0.0, outage=(0.0, 0.3), latency=0.0, seed=2)
+    results = make_results(50, poison=0, seed=2)
+
+    start = time.monotonic()
+    _, drained, stats = drain(tmp_path, client, results)
+
+    assert drained
+    assert time.monotonic() - start >= 0.3
+    assert stats["dead"] == 0
+    assert len(client.rows) == issue_rows(results)
+
+
+def test_plain_insert_replays_duplicate_rows(stand_in):
+    # The stand-in commits before losing the response, so a blind retry
+    # of an insert really does store the rows twice
+    client = stand_in(fail_rate=0.0, latency=0.0, ack_loss_rate=1.0)
+    rows = [{"image_url": "a.jpg", "title": "Potholes", "issue_key": "k"}]
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            client.table("civic_issues").insert(rows).execute()
+        with pytest.raises(TimeoutError):
+            client.table("civic_issues").upsert(rows, on_conflict="issue_key", ignore_duplicates=True).execute()
+    assert len(client.rows) == 3
+
+
+def test_spool_batch_reports_unreadable_images(tmp_path, stand_in):
+    connector = SupabaseConnector("", "", client=stand_in())
+    result = {"image_path": str(tmp_path / "missing.jpg"), "potholes": {"status": "present"}}
+
+    with UploadSpool(str(tmp_path / "spool.sqlite")) as spool:
+        summary = connector.spool_batch([result], spool)
+        assert spool.depth() == 0
+
+    assert summary["spooled"] == 0
+    assert summary["failed"] == 1
+    assert summary["errors"][0]["image_path"] == result["image_path"]
+
+
+def test_bulk_insert_retries_never_duplicate_rows(stand_in, make_results):
+    client = stand_in(fail_rate=0.2, latency=0.0, seed=3, ack_loss_rate=0.2)
+    results = make_results(200, poison=1, seed=3)
+    connector = SupabaseConnector("", "", client=client)
+
+    summary = connector.insert_batch_bulk(results, chunk_size=10, backoff=0.0)
+
+    assert client.lost_acks > 0
+    keys = Counter(row["issue_key"] for row in client.rows)
+    assert max(keys.values()) == 1
+    assert len(keys) >= summary["successful"]
+    assert summary["successful"] + summary["failed"] == summary["total_issues"] == issue_rows(results)
+    assert {error["image_path"] for error in summary["errors"]} >= {results[0]["image_path"]}
+
+
+def test_bulk_insert_falls_back_to_plain_inserts_without_the_migration(stand_in, make_results):
+    client = stand_in(fail_rate=0.0, latency=0.0, keyed=False)
+    results = make_results(40, poison=0, seed=4)
+    connector = SupabaseConnector("", "", client=client)
+
+    summary = connector.insert_batch_bulk(results, chunk_size=10, backoff=0.0)
+
+    assert not connector.issue_keys
+    assert summary["failed"] == 0 and summary["successful"] == len(client.rows) == issue_rows(results)
+    assert not any("issue_key" in row for row in client.rows)
+
+
+def test_plain_insert_fallback_never_resends_a_possibly_committed_chunk(stand_in, make_results):
+    client = stand_in(fail_rate=0.0, latency=0.0, keyed=False, ack_loss_rate=1.0)
+    results = make_results(20, poison=0, seed=5)
+
+    summary = SupabaseConnector("", "", client=client).insert_batch_bulk(results, chunk_size=5, backoff=0.0)
+
+    keys = Counter((row["image_url"], row["title"]) for row in client.rows)
+    assert max(keys.values()) == 1 and len(keys) == issue_rows(results)
+    assert summary["failed"] == issue_rows(results)
+
+
+def test_spool_drains_into_a_table_without_the_migration(tmp_path, stand_in, make_results):
+    client = stand_in(fail_rate=0.0, latency=0.0, keyed=False)
+    results = make_results(30, poison=0, seed=6)
+
+    _, drained, stats = drain(tmp_path, client, results)
+
+    assert drained and stats["dead"] == 0
+    assert len(client.rows) == issue_rows(results)
+
+
+def test_results_carry_the_content_hash_uploads_use(tmp_path, stand_in, monkeypatch):
+    paths = write_images(tmp_path, [96, 128])
+    system = CompleteCivicIssueDetectionSystem(model_type="mock")
+    results = system.process_batch(paths) + [system.process_image(paths[0], verbose=False)]
+
+    def unreadable(path):
+        raise AssertionError(f"{path} was read again at upload time")
+
+    monkeypatch.setattr(classifier, "file_content_hash", unreadable)
+    client = stand_in(fail_rate=0.0, latency=0.0)
+    summary = SupabaseConnector("", "", client=client).insert_batch_bulk(results, backoff=0.0)
+
+    expected = [hashlib.sha256(Path(path).read_bytes()).hexdigest() for path in paths + paths[:1]]
+    assert [result["content_hash"] for result in results] == expected
+    assert summary["failed"] == 0
+
+
+# ==================== UPLOAD INDEX ====================
+
+def moved(results, old, new):
+    return [{**result, "image_path": result["image_path"].replace(old, new)} for result in results]
+
+
+def test_upsert_batch_sends_only_new_and_changed_issues(tmp_path, stand_in, make_results):
+    client = stand_in(fail_rate=0.0, latency=0.0)
+    connector = SupabaseConnector("", "", client=client)
+    results = make_results(20, poison=0, seed=7)
+    rows = issue_rows(results)
+
+    with UploadIndex(str(tmp_path / "index.sqlite")) as index:
+        first = connector.upsert_batch(results, index, backoff=0.0)
+        requests = client.requests
+        second = connector.upsert_batch(results, index, backoff=0.0)
+        assert client.requests == requests
+        third = connector.upsert_batch(moved(results, "img_", "renamed_"), index, backoff=0.0)
+        assert len(index) == rows
+
+    assert (first["successful"], first["unchanged"]) == (rows, 0)
+    assert (second["successful"], second["unchanged"]) == (0, rows)
+    assert (third["successful"], third["unchanged"]) == (rows, 0)
+    assert len(client.rows) == rows
+    assert all("renamed_" in row["image_url"] for row in client.rows)
+
+
+def test_upsert_batch_keeps_the_server_status_and_restores_lost_rows(tmp_path, stand_in, make_results):
+    client = stand_in(fail_rate=0.0, latency=0.0)
+    connector = SupabaseConnector("", "", client=client)
+    results = make_results(10, poison=0, seed=8)
+
+    with UploadIndex(str(tmp_path / "index.sqlite")) as index:
+        connector.upsert_batch(results, index, backoff=0.0)
+        client.rows[0]["status"] = "in_progress"
+        lost = client.rows.pop()
+        client._keys = {row["issue_key"]: position for position, row in enumerate(client.rows)}
+        connector.upsert_batch(moved(results, "img_", "renamed_"), index, backoff=0.0)
+
+    statuses = {row["issue_key"]: row["status"] for row in client.rows}
+    assert statuses[client.rows[0]["issue_key"]] == "in_progress"
+    assert statuses[lost["issue_key"]] == "draft"
+    assert len(client.rows) == issue_rows(results)
+
+
+def test_failed_upsert_leaves_the_index_untouched(tmp_path, stand_in, make_results):
+    connector = SupabaseConnector("", "", client=stand_in(fail_rate=1.0, latency=0.0))
+    results = make_results(10, poison=0, seed=9)
+
+    with UploadIndex(str(tmp_path / "index.sqlite")) as index:
+        summary = connector.upsert_batch(results, index, max_retries=1, backoff=0.0)
+        assert len(index) == 0
+
+    assert summary["successful"] == 0
+    assert summary["failed"] == summary["total_issues"] == issue_rows(results)
+
+
+# ==================== ISSUE REGISTRY ====================
+
+def test_issues_skip_categories_missing_from_result(stand_in):
+    # A system built with categories=[...] only produces those keys
+    result = {"image_path": "Sector 1/a.jpg", "waterlogging": {"status": "issue"}}
+    connector = SupabaseConnector("", "", client=stand_in())
+
+    assert [issue["title"] for issue in format_issues(result)] == ["Drains Clogging"]
+    assert [row["title"] for row in connector.generate_title_and_description(result)] == ["Drains Clogging"]
+
+
+def test_fingerprint_changes_when_a_category_is_registered():
+    class Classifier(EnhancedCivicIssueClassifier):
+        pass
+
+    model = SimpleNamespace(model_type="mock", weights=None, analysis_size=640)
+    before = result_fingerprint(model, Classifier())
+
+    @Classifier.register_category("graffiti")
+    def graffiti(classifier, analysis, features, buckets):
+        return {"status": "not_present"}
+
+    assert result_fingerprint(model, Classifier()) != before
+    assert result_fingerprint(model, Classifier(), categories=["potholes"]) == \
+        result_fingerprint(model, EnhancedCivicIssueClassifier(), categories=["potholes"])
+
+
+def test_subclass_categories_raise_issues_everywhere(stand_in):
+    class Classifier(EnhancedCivicIssueClassifier):
+        pass
+
+    @Classifier.register_category("graffiti", issues=[
+        IssueType("present", "Graffiti", "Graffiti on public walls", "Graffiti found")
+    ])
+    def graffiti(classifier, analysis, features, buckets):
+        return {"status": "present"}
+
+    system = CompleteCivicIssueDetectionSystem(model_type="mock")
+    system.classifier = Classifier()
+    result = {"image_path": "Sector 1/a.jpg", "graffiti": {"status": "present"}}
+    registry = system.classifier.CATEGORIES
+    aggregator = TemporalIssueAggregator("clip.mp4", min_frames=1, registry=registry)
+    aggregator.add(0.0, result)
+
+    assert [issue["title"] for issue in format_issues(result, registry)] == ["Graffiti"]
+    assert [row["title"] for row in SupabaseConnector(
+        "", "", client=stand_in(), registry=registry
+    ).generate_title_and_description(result)] == ["Graffiti"]
+    assert system.build_report("a.jpg", result)["summary"]["critical_issues"] == 1
+    assert [event["category"] for event in aggregator.finish()] == ["graffiti"]
+    assert format_issues(result) == []
+
+
+# ==================== RESULT SINK ====================
+
+POTHOLE = {"potholes": {"status": "present"}}
+
+
+def test_resume_cuts_off_a_torn_record(tmp_path):
+    path = tmp_path / "results.ndjson"
+    with NDJSONResultWriter(str(path)) as sink:
+        sink.write({"image_path": "a.jpg", **POTHOLE})
+        sink.write({"image_path": "b.jpg", "error": "unreadable"})
+    with open(path, "ab") as f:
+        f.write(b'{"image_path": "c.jp')
+
+    with NDJSONResultWriter(str(path), resume=True) as sink:
+        assert sink.completed == {"a.jpg"}
+        sink.write({"image_path": "b.jpg", **POTHOLE})
+
+    assert [record["image_path"] for record in read_ndjson(str(path))] == ["a.jpg", "b.jpg", "b.jpg"]
+
+
+def test_offsets_stay_valid_across_resumes(tmp_path):
+    path = str(tmp_path / "results.ndjson")
+    offsets = {}
+    with NDJSONResultWriter(path) as sink:
+        for name in ("a.jpg", "b.jpg"):
+            offsets[name] = sink.write({"image_path": name, **POTHOLE})
+    with NDJSONResultWriter(path, resume=True) as sink:
+        offsets["c.jpg"] = sink.write({"image_path": "c.jpg", **POTHOLE})
+
+    names = ["c.jpg", "a.jpg", "b.jpg"]
+    assert [record["image_path"] for record in read_ndjson_at(path, [offsets[name] for name in names])] == names
+
+
+def test_resume_drops_formatted_issues_of_a_torn_result(tmp_path):
+    path, formatted = tmp_path / "results.ndjson", tmp_path / "issues.ndjson"
+    with NDJSONResultWriter(str(path), str(formatted)) as sink:
+        sink.write({"image_path": "a.jpg", **POTHOLE})
+        torn_at = sink.write({"image_path": "b.jpg", **POTHOLE})
+    with open(path, "rb+") as f:
+        f.truncate(torn_at + 5)
+
+    with NDJSONResultWriter(str(path), str(formatted), resume=True) as sink:
+        assert sink.completed == {"a.jpg"}
+
+    assert [issue["image_url"] for issue in read_ndjson(str(formatted))] == ["a.jpg"]
+
+
+# ==================== PROGRESS LOG ====================
+
+def test_iter_batch_skips_completed_images_and_retries_failures(tmp_path):
+    paths = write_images(tmp_path, [64, 96, 128])
+    missing = str(tmp_path / "missing.png")
+    system = CompleteCivicIssueDetectionSystem(model_type="mock")
+
+    with ProgressLog(str(tmp_path / "progress.db")) as progress:
+        first = system.process_batch(paths + [missing], progress=progress)
+    assert [result["image"] for result in first] == paths + [missing]
+
+    cv2.imwrite(paths[1], np.zeros((80, 64, 3), dtype=np.uint8))
+    with ProgressLog(str(tmp_path / "progress.db")) as progress:
+        second = system.process_batch(paths + [missing], progress=progress)
+        assert progress.completed(paths + [missing]) == set(paths)
+    assert [result["image"] for result in second] == [paths[1], missing]
+
+
+def test_iter_batch_records_only_results_the_caller_moved_past(tmp_path):
+    paths = write_images(tmp_path, [64, 96, 128])
+    system = CompleteCivicIssueDetectionSystem(model_type="mock")
+
+    with ProgressLog(str(tmp_path / "progress.db")) as progress:
+        batch = system.iter_batch(paths, batch_size=1, progress=progress)
+        next(batch)
+        next(batch)
+        batch.close()
+        assert progress.completed(paths) == {paths[0]}
+
+
+def test_resume_uploads_what_was_classified_before_a_crash(tmp_path, stand_in):
+    paths = write_images(tmp_path, [64, 96])
+    results_path, progress_path = str(tmp_path / "results.ndjson"), str(tmp_path / "progress.db")
+    system = CompleteCivicIssueDetectionSystem(model_type="mock")
+
+    # First run: classified and checkpointed, then killed before uploading
+    sink, progress = NDJSONResultWriter(results_path), ProgressLog(progress_path)
+    for result in system.iter_batch(paths):
+        image_path = result.pop("image")
+        progress.add(image_path, "classified", sink.write({**result, **POTHOLE}))
+    progress.commit(sink)
+    sink.close()
+    progress.close()
+
+    client = stand_in(fail_rate=0.0, latency=0.0)
+    with ProgressLog(progress_path) as progress:
+        assert progress.completed(paths) == set(paths)
+        pending = progress.awaiting_upload()
+        summary = SupabaseConnector("", "", client=client).insert_batch_bulk(
+            list(read_ndjson_at(results_path, [offset for _, offset in pending])), backoff=0.0
+        )
+        progress.mark_uploaded(path for path, _ in pending)
+
+    assert summary["failed"] == 0
+    assert sorted(row["image_url"] for row in client.rows if row["title"] == "Potholes") == paths
+    with ProgressLog(progress_path) as progress:
+        assert progress.awaiting_upload() == []
+
+
+# ==================== INFERENCE SERVER ====================
+
+def test_server_answers_unexpected_errors_with_500():
+    def broken_load(image_path, data):
+        raise RuntimeError("decoder crashed")
+
+    system = SimpleNamespace(
+        vision_model=SimpleNamespace(batch_size=4, model_type="mock"), _load=broken_load
+    )
+    server = InferenceServer(system)
+    headers = {"content-type": "application/json"}
+
+    status, payload = asyncio.run(server._route("POST", "/classify", headers, b'{"path": "a.jpg"}'))
+
+    assert status == 500
+    assert payload == {"success": False, "error": "RuntimeError: decoder crashed"}
+    assert server.stats()["errors"] == 1
+
+
+async def http_request(port, method, target, headers, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {target} HTTP/1.1", f"Content-Length: {len(body)}", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    response_headers = dict(line.split(": ", 1) for line in header_lines)
+    return int(status_line.split()[1]), response_headers, payload
+
+
+def serve_requests(tmp_path, requests, **options):
+    path = write_images(tmp_path, [64])[0]
+
+    async def run():
+        server = InferenceServer(CompleteCivicIssueDetectionSystem(model_type="mock"), port=0, **options)
+        _, port = await server.start()
+        try:
+            return [
+                await http_request(port, method, target, headers, json.dumps({"path": path}).encode())
+                for method, target, headers in requests
+            ]
+        finally:
+            await server.stop()
+
+    return asyncio.run(run())
+
+
+def test_server_sends_no_cors_headers_and_refuses_browser_path_requests(tmp_path):
+    json_body = {"Content-Type": "application/json"}
+    preflight, from_page, local = serve_requests(tmp_path, [
+        ("OPTIONS", "/classify", {"Origin": "http://evil.example"}),
+        ("POST", "/classify", {**json_body, "Origin": "http://evil.example"}),
+        ("POST", "/classify", json_body),
+    ])
+
+    assert all(not any(name.startswith("Access-Control") for name in headers)
+               for _, headers, _ in (preflight, from_page, local))
+    assert from_page[0] == 403
+    assert local[0] == 200 and "error" not in json.loads(local[2])
+
+
+def test_server_allows_only_its_configured_cors_origin(tmp_path):
+    origin = "http://localhost:5500"
+    allowed, other = serve_requests(tmp_path, [
+        ("OPTIONS", "/classify", {"Origin": origin}),
+        ("OPTIONS", "/classify", {"Origin": "http://evil.example"}),
+    ], cors_origin=origin)
+
+    assert allowed[1]["Access-Control-Allow-Origin"] == origin
+    assert "Access-Control-Allow-Origin" not in other[1]
+    with pytest.raises(ValueError):
+        InferenceServer(CompleteCivicIssueDetectionSystem(model_type="mock"), cors_origin="*")
+
+
+# ==================== BATCHED DETECTION ====================
+
+def write_images(tmp_path, heights):
+    rng = np.random.default_rng(0)
+    paths = []
+    for index, height in enumerate(heights):
+        path = str(tmp_path / f"image_{index}.png")
+        cv2.imwrite(path, rng.integers(0, 256, (height, 64, 3), dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+
+def test_batch_detection_failure_only_fails_the_bad_image(tmp_path, monkeypatch):
+    system = CompleteCivicIssueDetectionSystem(model_type="mock")
+    detect_batch = system.vision_model.detect_batch
+    batch_sizes = []
+
+    def fragile_detect_batch(images, batch_size=None, **options):
+        batch_sizes.append(batch_size)
+        if any(image.shape[0] == 13 for image in images):
+            raise RuntimeError("detector rejected the batch")
+        return detect_batch(images, batch_size=batch_size, **options)
+
+    monkeypatch.setattr(system.vision_model, "detect_batch", fragile_detect_batch)
+    results = system.process_batch(write_images(tmp_path, [48, 13, 64]), batch_size=3)
+
+    assert ["error" in result for result in results] == [False, True, False]
+    assert results[1]["error"] == "detector rejected the batch"
+    assert batch_sizes[0] == 3
+
+
+# ==================== ANALYSIS RESOLUTION ====================
+
+def test_reduced_decode_picks_the_largest_jpeg_scale_that_fits():
+    assert reduced_decode_flag((4000, 3000), 500) == cv2.IMREAD_REDUCED_COLOR_8
+    assert reduced_decode_flag((4000, 3000), 501) == cv2.IMREAD_REDUCED_COLOR_4
+    assert reduced_decode_flag((3000, 4000), 1500) == cv2.IMREAD_REDUCED_COLOR_2
+    assert reduced_decode_flag((640, 480), 500) == cv2.IMREAD_COLOR
+    assert reduced_decode_flag(None, 500) == cv2.IMREAD_COLOR
+
+
+def test_reduced_analysis_reports_boxes_in_original_coordinates(tmp_path):
+    path = str(tmp_path / "street.jpg")
+    cv2.imwrite(path, benchmark.synthetic_civic_image(2000, 1500, 0))
+    full = classifier.VisionModelWrapper(model_type="mock")
+    reduced = classifier.VisionModelWrapper(model_type="mock", analysis_size=500)
+
+    img, original_size = reduced.read_image(path)
+    assert img.shape[:2] == (375, 500) and original_size == (2000, 1500)
+
+    expected, full_img = full.process_image(path)
+    analysis, reduced_img = reduced.process_image(path)
+    assert (analysis.width, analysis.height) == (2000, 1500)
+    labels = [obj.label for obj in analysis.detected_objects]
+    assert labels == [obj.label for obj in expected.detected_objects]
+    for obj, reference in zip(analysis.detected_objects, expected.detected_objects):
+        assert np.abs(np.subtract(obj.bbox, reference.bbox)).max() <= 8
+        assert obj.area_percentage == pytest.approx(reference.area_percentage, abs=0.5)
+
+    issues = EnhancedCivicIssueClassifier()
+    assert issues.classify_all_issues(analysis, reduced_img) == issues.classify_all_issues(expected, full_img)
+
+
+# ==================== MOCK DETECTOR ====================
+
+def test_mock_label_map_matches_the_direct_colour_tests():
+    image = np.random.default_rng(2).integers(0, 256, (37, 53, 3), dtype=np.uint8)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+    labels = mock_label_map(image)
+
+    assert labels.shape == (37, 53)
+    assert np.array_equal(labels & MOCK_DARK > 0, gray <= 50)
+    assert np.array_equal(
+        labels & MOCK_WATER > 0,
+        cv2.inRange(hsv, np.array((90, 50, 50)), np.array((130, 255, 255))) > 0
+    )
+
+
+# ==================== FEATURE CONTEXT ====================
+
+def test_detection_and_classification_convert_each_plane_once(monkeypatch):
+    image = benchmark.synthetic_civic_image(640, 480, 3)
+    conversions = Counter()
+    convert = cv2.cvtColor
+
+    def counting_convert(pixels, code, *args, **kwargs):
+        conversions[code, pixels.shape[:2]] += 1
+        return convert(pixels, code, *args, **kwargs)
+
+    vision = classifier.VisionModelWrapper(model_type="mock")
+    monkeypatch.setattr(cv2, "cvtColor", counting_convert)
+    features = ImageFeatures(image)
+    analysis = vision.detect(image, features)
+    EnhancedCivicIssueClassifier().classify_all_issues(analysis, image, features)
+
+    assert conversions and max(conversions.values()) == 1
+
+
+def test_feature_regions_match_direct_conversions():
+    image = np.random.default_rng(4).integers(0, 256, (61, 40, 3), dtype=np.uint8)
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    features = ImageFeatures(image)
+
+    # Converted on its own while no full plane exists, then sliced from one
+    assert np.array_equal(features.region("hsv", "lower_half"), hsv[30:])
+    assert np.array_equal(features.region("gray", "upper_third"),
+                          cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)[:20])
+    features.prepare([("hsv", "full"), ("hsv", "upper_third")])
+    assert np.shares_memory(features.region("hsv", "upper_third"), features.hsv)
+
+    mask = features.in_range((90, 50, 50), (130, 255, 255), "lower_half")
+    assert features.in_range((90, 50, 50), (130, 255, 255), "lower_half") is mask
+    assert np.array_equal(mask, cv2.inRange(hsv[30:], np.array((90, 50, 50)), np.array((130, 255, 255))))
+    with pytest.raises(ValueError):
+        features.region("hsv", "left_half")
+
+
+# ==================== DETECTION COLUMNS ====================
+
+class HostCopyCounter:
+    """Tensor stand-in counting the copies to the host"""
+
+    copies = 0
+
+    def __init__(self, values):
+        self.values = np.array(values)
+
+    def cpu(self):
+        HostCopyCounter.copies += 1
+        return SimpleNamespace(numpy=lambda: self.values)
+
+
+def test_columns_iterate_as_the_objects_they_were_built_from():
+    objects = [
+        DetectedObject("person", 0.9, (1, 2, 3, 4), 0.5),
+        DetectedObject("car", 0.6, (5, 6, 7, 8), 12.0),
+        DetectedObject("person", 0.3, (9, 10, 11, 12), 2.5)
+    ]
+
+    columns = ImageAnalysis(100, 100, objects).columns
+
+    assert isinstance(columns, DetectionColumns)
+    assert list(columns) == objects and columns[2] == objects[2]
+    assert columns.labels == ("person", "car")
+    people = columns.subset(columns.label_ids == 0)
+    assert people.labels is columns.labels and list(people) == [objects[0], objects[2]]
+    assert DetectionColumns.from_objects([]).bbox.shape == (0, 4)
+
+    restored = analysis_from_dict(json.loads(json.dumps(analysis_to_dict(ImageAnalysis(100, 100, columns)))))
+    assert list(restored.detected_objects) == objects
+
+
+def test_yolo_columns_copy_each_box_tensor_to_the_host_once():
+    boxes = SimpleNamespace(
+        cls=HostCopyCounter([1.0, 0.0, 1.0]),
+        conf=HostCopyCounter([0.9, 0.8, 0.7]),
+        xyxy=HostCopyCounter([[10, 20, 30, 60], [0, 0, 50, 50], [90, 90, 100, 100]])
+    )
+    HostCopyCounter.copies = 0
+
+    columns = DetectionColumns.from_yolo(SimpleNamespace(boxes=boxes), ("person", "car"), 100 * 100)
+
+    assert HostCopyCounter.copies == 3
+    assert [obj.label for obj in columns] == ["car", "person", "car"]
+    assert columns[0].bbox == (10, 20, 20, 40)
+    assert columns.area.tolist() == pytest.approx([8.0, 25.0, 1.0])
+
+
+# ==================== LABEL INDEX ====================
+
+LABELS = ("Traffic Light", "pothole", "dark_region", "Wet Road", "log pile", "cardboard box",
+          "person", "Fire Hydrant", "broken bottle", "")
+
+
+def substring_categories(issues, label):
+    """Categories the per-object substring loops matched before the index existed"""
+    indicators = {
+        "pothole": issues.POTHOLE_INDICATORS, "dark_hole": issues.DARK_HOLE_MARKERS,
+        "garbage": issues.GARBAGE_INDICATORS, "light": issues.LIGHT_INDICATORS,
+        "water": issues.WATER_INDICATORS, "tree": issues.TREE_INDICATORS
+    }
+    return {
+        category for category, words in indicators.items()
+        if any(word in label.lower() for word in words)
+    }
+
+
+def test_label_index_matches_substring_matching():
+    issues = EnhancedCivicIssueClassifier()
+
+    for label in LABELS:
+        assert issues.label_categories(label) == substring_categories(issues, label), label
+        assert issues.label_categories(label) is issues.label_categories(label)
+
+
+def test_buckets_keep_detection_order_and_the_small_object_garbage_rule():
+    issues = EnhancedCivicIssueClassifier()
+    objects = [
+        DetectedObject(label, 0.9 if index % 2 else 0.4, (index, index, 10, 10), 0.5 if index % 3 else 3.0)
+        for index, label in enumerate(LABELS * 2)
+    ]
+
+    buckets = issues.bucket_detections(ImageAnalysis(100, 100, objects))
+
+    for category, bucket in buckets.items():
+        expected = [
+            obj for obj in objects
+            if category in substring_categories(issues, obj.label)
+            or (category == "garbage" and obj.area_percentage < 1.0 and obj.confidence > 0.5)
+        ]
+        assert list(bucket) == expected, category
+    assert list(buckets["garbage"]) == [obj for obj in objects if issues._is_garbage_indicator(obj)]
+
+
+# ==================== TILED PROCESSING ====================
+
+def test_tiles_cover_the_image_and_end_on_its_border():
+    tiles = plan_tiles(1000, 700, 400, 100)
+
+    covered = np.zeros((700, 1000), dtype=bool)
+    for tile in tiles:
+        assert (tile.width, tile.height) == (400, 400)
+        covered[tile.y:tile.y + tile.height, tile.x:tile.x + tile.width] = True
+    assert covered.all()
+    assert sorted({tile.x for tile in tiles}) == [0, 300, 600]
+    assert sorted({tile.y for tile in tiles}) == [0, 300]
+
+    assert plan_tiles(300, 200, 400, 50) == [Tile(0, 0, 300, 200)]
+    with pytest.raises(ValueError):
+        plan_tiles(1000, 700, 400, 400)
+
+
+def columns(*objects):
+    return DetectionColumns.from_objects([DetectedObject(*obj) for obj in objects])
+
+
+def test_merge_joins_an_object_cut_by_a_tile_boundary():
+    left, right = Tile(0, 0, 100, 100), Tile(80, 0, 100, 100)
+    parts = [
+        # 40x20 and 30x20 halves of one 50x20 pothole, plus a lone car
+        (left, columns(("pothole", 0.6, (60, 10, 40, 20), 8.0), ("car", 0.9, (5, 5, 10, 10), 1.0))),
+        (right, columns(("pothole", 0.8, (0, 10, 30, 20), 6.0))),
+    ]
+
+    merged = {obj.label: obj for obj in merge_tile_detections(parts, 180, 100)}
+
+    assert merged["pothole"].bbox == (60, 10, 50, 20)
+    assert merged["pothole"].confidence == pytest.approx(0.8)
+    # The union box's share of the image, not the halves' sum
+    assert merged["pothole"].area_percentage == pytest.approx(50 * 20 / (180 * 100) * 100)
+    assert merged["car"].bbox == (5, 5, 10, 10)
+    assert merged["car"].area_percentage == pytest.approx(100 / 18000 * 100)
+
+
+def test_merge_keeps_same_label_objects_apart_when_they_do_not_meet():
+    left, right = Tile(0, 0, 100, 100), Tile(80, 0, 100, 100)
+    parts = [
+        (left, columns(("pothole", 0.6, (10, 10, 20, 20), 4.0))),
+        (right, columns(("pothole", 0.8, (50, 50, 20, 20), 4.0), ("pothole", 0.7, (0, 60, 30, 20), 6.0))),
+    ]
+
+    boxes = sorted(obj.bbox for obj in merge_tile_detections(parts, 180, 100))
+
+    assert boxes == [(10, 10, 20, 20), (80, 60, 30, 20), (130, 50, 20, 20)]
+
+
+def test_tiled_near_duplicate_skips_the_full_decode(tmp_path, monkeypatch):
+    scene = np.full((600, 800, 3), 150, dtype=np.uint8)
+    cv2.circle(scene, (400, 400), 80, (10, 10, 10), -1)
+    folder = tmp_path / "Sector 2"
+    folder.mkdir()
+    paths = [str(folder / "first.jpg"), str(folder / "second.jpg")]
+    cv2.imwrite(paths[0], scene, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    cv2.imwrite(paths[1], scene, [cv2.IMWRITE_JPEG_QUALITY, 80])
+
+    full_decodes = []
+    imdecode = cv2.imdecode
+
+    def counting_imdecode(buffer, flags):
+        if flags == cv2.IMREAD_COLOR:
+            full_decodes.append(len(buffer))
+        return imdecode(buffer, flags)
+
+    monkeypatch.setattr(classifier.cv2, "imdecode", counting_imdecode)
+    system = CompleteCivicIssueDetectionSystem(
+        model_type="mock", analysis_size=200, tile_size=256, tile_overlap=32, tile_min_megapixels=0.1,
+        dedup_distance=4
+    )
+    first, second = (system.process_image(path, verbose=False) for path in paths)
+
+    assert second["duplicate_of"] == paths[0]
+    assert {key: value for key, value in second.items() if key in issue_statuses()} == {
+        key: value for key, value in first.items() if key in issue_statuses()
+    }
+    assert len(full_decodes) == 1
+
+
+# ==================== STARTUP ====================
+
+def test_import_leaves_heavy_dependencies_unloaded():
+    code = (
+        "import sys, classifier; classifier.SupabaseConnector('http://localhost', 'key'); "
+        "print(sorted(name for name in ('torch', 'ultralytics', 'supabase', 'onnxruntime') "
+        "if name in sys.modules))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        cwd=Path(__file__).resolve().parent
+    )
+
+    assert completed.stdout == "[]\n"
+
+
+# ==================== ONNX HELPERS ====================
+
+def test_letterbox_keeps_aspect_ratio_and_centres_the_image():
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+
+    tensor, ratio, (pad_x, pad_y) = letterbox(image, 640)
+
+    assert tensor.shape == (1, 3, 640, 640) and tensor.dtype == np.float32
+    assert ratio == 3.2 and (pad_x, pad_y) == (0, 160)
+    assert np.allclose(tensor[0, :, :160], ONNX_PAD_VALUE / 255)
+    assert np.allclose(tensor[0, :, 160:480], 0)
+
+
+def test_nms_drops_overlapping_boxes_of_lower_score():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+
+    assert nms(boxes, scores, 0.5).tolist() == [1, 2]
+
+
+def test_decode_yolo_output_maps_boxes_back_to_the_image():
+    # Two anchors on the same object, one on another class, one below threshold
+    output = np.zeros((84, 4), dtype=np.float32)
+    output[:4, 0] = (320, 320, 64, 32)
+    output[:4, 1] = (322, 321, 64, 32)
+    output[:4, 2] = (320, 320, 64, 32)
+    output[:4, 3] = (100, 300, 20, 20)
+    output[4 + 0, 0], output[4 + 0, 1], output[4 + 5, 2], output[4 + 0, 3] = 0.9, 0.6, 0.8, 0.1
+
+    class_ids, confidence, xyxy = decode_yolo_output(output, ratio=3.2, pad=(0, 160), width=200, height=100)
+
+    assert class_ids.tolist() == [0, 5]
+    assert np.allclose(confidence, [0.9, 0.8])
+    # Centre (320, 320), size 64 x 32 in the letterboxed input, minus the padding, over the ratio
+    assert np.allclose(xyxy[0], np.array([288, 144, 352, 176]) / 3.2)
+
+
+class WhiteBoxSession:
+    """
+    ONNX Runtime stand-in that "detects" the white rectangle in each input.
+
+    It finds the rectangle in the letterboxed tensor it is given and answers
+    with YOLOv8-shaped output: the box as a car at 0.9, a shifted copy at 0.6
+    that NMS must drop, and a faint anchor below the confidence threshold.
+    """
+
+    def __init__(self, batch):
+        self.batch = batch
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="images", shape=[self.batch, 3, 640, 640])]
+
+    def get_modelmeta(self):
+        return SimpleNamespace(custom_metadata_map={"names": "{0: 'person', 1: 'bicycle', 2: 'car'}"})
+
+    def run(self, output_names, feeds):
+        outputs = []
+        for tensor in feeds["images"]:
+            ys, xs = np.nonzero(tensor.min(axis=0) > 0.5)
+            x0, y0, x1, y1 = xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+            box = ((x0 + x1) / 2, (y0 + y1) / 2, x1 - x0, y1 - y0)
+            output = np.zeros((84, 3), dtype=np.float32)
+            output[:4, 0], output[4 + 2, 0] = box, 0.9
+            output[:4, 1], output[4 + 2, 1] = (box[0] + 3, box[1] + 2, box[2], box[3]), 0.6
+            output[:4, 2], output[4 + 0, 2] = (100, 100, 10, 10), 0.1
+            outputs.append(output)
+        return [np.stack(outputs)]
+
+
+@pytest.mark.parametrize("batch", ["batch", 1])
+def test_onnx_backend_finds_boxes_in_original_coordinates(batch):
+    wide = np.zeros((100, 200, 3), dtype=np.uint8)
+    cv2.rectangle(wide, (40, 30), (79, 59), (255, 255, 255), -1)
+    tall = np.zeros((160, 90, 3), dtype=np.uint8)
+    cv2.rectangle(tall, (10, 100), (49, 139), (255, 255, 255), -1)
+    model = classifier.VisionModelWrapper(model_type="mock")
+    model.model_type, model.model = "onnx", WhiteBoxSession(batch)
+
+    wide_analysis, tall_analysis = model.detect_batch([wide, tall])
+
+    for analysis, expected in ((wide_analysis, (40, 30, 40, 30)), (tall_analysis, (10, 100, 40, 40))):
+        [car] = list(analysis.detected_objects)
+        assert car.label == "car" and car.confidence == pytest.approx(0.9)
+        assert np.allclose(car.bbox, expected, atol=1)
+        assert car.area_percentage == pytest.approx(
+            expected[2] * expected[3] / (analysis.width * analysis.height) * 100, rel=0.1
+        )
+
+
+# ==================== VIDEO ====================
+
+def test_aggregator_merges_frames_into_events():
+    aggregator = TemporalIssueAggregator("clip.mp4", max_gap=1.0, min_frames=2, source_hash="abc")
+    pothole, clear = {"potholes": {"status": "present"}}, {"potholes": {"status": "not_present"}}
+    for timestamp, result in [(0.0, pothole), (0.5, pothole), (1.0, pothole), (1.5, clear),
+                              (3.0, pothole), (3.5, pothole), (6.0, pothole)]:
+        aggregator.add(timestamp, result)
+
+    events = aggregator.finish()
+
+    assert [(event["start_time"], event["end_time"], event["frames"]) for event in events] == [
+        (0.0, 1.0, 3), (3.0, 3.5, 2)
+    ]
+    assert len({event["content_hash"] for event in events}) == 2
+    again = TemporalIssueAggregator("moved.mp4", max_gap=1.0, source_hash="abc")
+    again.add(0.0, pothole)
+    again.add(0.5, pothole)
+    assert again.finish()[0]["content_hash"] == events[0]["content_hash"]
+
+
+def test_video_events_upload_without_a_file_behind_them(tmp_path, stand_in, synthetic_video):
+    video = synthetic_video(
+        str(tmp_path / "dashcam.mp4"), width=160, height=96, fps=10, scenes=2,
+        seconds_per_scene=1.0, still_seconds=2.0
+    )
+    system = CompleteCivicIssueDetectionSystem(model_type="mock")
+
+    summary = system.process_video(video, sample_fps=5.0, min_frames=1)
+    client = stand_in(fail_rate=0.0, latency=0.0)
+    upload = SupabaseConnector("", "", client=client).insert_batch_bulk(summary["issues"], backoff=0.0)
+
+    assert summary["frames_static"] > 0
+    assert summary["frames_analyzed"] == summary["frames_sampled"] - summary["frames_static"]
+    assert summary["issues"] and all(event["content_hash"] for event in summary["issues"])
+    assert upload["failed"] == 0 and upload["successful"] == len(client.rows) > 0
+
+
+# ==================== RESULT CACHE ====================
+
+def test_cache_hits_across_systems_sharing_its_file(tmp_path):
+    path = write_images(tmp_path, [64])[0]
+    cache_path = str(tmp_path / "cache.db")
+
+    with CompleteCivicIssueDetectionSystem(model_type="mock", cache_path=cache_path) as system:
+        first = system.process_image(path, verbose=False)
+        second = system.process_image(path, verbose=False)
+        assert (system.cache.hits, system.cache.misses) == (1, 1)
+    with CompleteCivicIssueDetectionSystem(model_type="mock", cache_path=cache_path) as system:
+        third = system.process_image(path, verbose=False)
+        assert (system.cache.hits, system.cache.misses) == (1, 0)
+
+    assert first == second == third
+
+
+def test_fingerprint_covers_every_result_setting(monkeypatch):
+    model = SimpleNamespace(model_type="mock", weights=None, analysis_size=640)
+    before = result_fingerprint(model, EnhancedCivicIssueClassifier())
+
+    class Markers(EnhancedCivicIssueClassifier):
+        DARK_HOLE_MARKERS = ("dark",)
+
+    assert result_fingerprint(model, Markers()) != before
+    monkeypatch.setattr(classifier, "MOCK_TABLE_SLAB", 8)
+    assert result_fingerprint(model, EnhancedCivicIssueClassifier()) == before
+    monkeypatch.setattr(classifier, "MOCK_POTHOLE_MIN_AREA", 0.05)
+    assert result_fingerprint(model, EnhancedCivicIssueClassifier()) != before
+
+
+def test_eviction_keeps_entries_hit_since_they_were_stored(tmp_path):
+    analysis = ImageAnalysis(width=1, height=1, detected_objects=[])
+    cache = ResultCache(str(tmp_path / "cache.db"), "fingerprint", max_entries=2)
+    cache.put("a", analysis, POTHOLE)
+    cache.put("b", analysis, POTHOLE)
+    assert cache.get("a") is not None
+
+    cache.put("c", analysis, POTHOLE)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+
+# ==================== DIRECTORY MANIFEST ====================
+
+def write_tree(root, files):
+    for rel_path, value in files.items():
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(path), np.full((32, 32, 3), value, dtype=np.uint8))
+
+
+def test_scan_hashes_only_files_whose_size_or_mtime_moved(tmp_path):
+    root = tmp_path / "scan"
+    write_tree(root, {"Sector 1/a.png": 10, "Sector 1/b.png": 20, "Sector 2/c.png": 30})
+    (root / "notes.txt").write_text("not an image")
+
+    with DirectoryManifest(str(tmp_path / "manifest.db")) as manifest:
+        first = manifest.scan(str(root))
+        assert (len(first.new), first.hashed) == (3, 3)
+
+        again = manifest.scan(str(root))
+        assert (again.new, again.changed, again.deleted, again.unchanged, again.hashed) == ([], [], [], 3, 0)
+
+        # Same bytes with a new mtime: hashed, but not a change
+        stat = (root / "Sector 1/a.png").stat()
+        os.utime(root / "Sector 1/a.png", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        write_tree(root, {"Sector 2/c.png": 40})
+        (root / "Sector 1/b.png").unlink()
+        final = manifest.scan(str(root))
+
+    assert final.hashed == 2
+    assert final.changed == [str(root / "Sector 2/c.png")]
+    assert final.deleted == [str(root / "Sector 1/b.png")]
+    assert final.unchanged == 1
+
+
+def test_pending_follows_processing_and_content_changes(tmp_path):
+    root = tmp_path / "scan"
+    write_tree(root, {"Sector 1/a.png": 10, "Sector 2/b.png": 20, "c.png": 30})
+
+    with DirectoryManifest(str(tmp_path / "manifest.db")) as manifest:
+        manifest.scan(str(root))
+        assert manifest.pending(str(root)) == {
+            "Sector 1": [str(root / "Sector 1/a.png")],
+            "Sector 2": [str(root / "Sector 2/b.png")],
+            None: [str(root / "c.png")],
+        }
+
+        manifest.mark_processed(str(root), [str(root / "Sector 1/a.png"), str(root / "c.png")])
+        assert manifest.pending(str(root)) == {"Sector 2": [str(root / "Sector 2/b.png")]}
+
+        write_tree(root, {"Sector 1/a.png": 11})
+        manifest.scan(str(root))
+        assert set(manifest.pending(str(root))) == {"Sector 1", "Sector 2"}
+
+
+def test_prune_deletions_drops_cached_results_and_upload_keys(tmp_path, stand_in):
+    root = tmp_path / "scan"
+    # kept.png has the same bytes as gone.png in another folder
+    write_tree(root, {"Sector 1/gone.png": 10, "Sector 1/other.png": 20, "Sector 3/kept.png": 10})
+    paths = [str(root / "Sector 1/gone.png"), str(root / "Sector 1/other.png")]
+    hashes = [hashlib.sha256(Path(path).read_bytes()).hexdigest() for path in paths]
+    system = CompleteCivicIssueDetectionSystem(model_type="mock", cache_path=str(tmp_path / "cache.db"))
+    manifest = DirectoryManifest(str(tmp_path / "manifest.db"))
+    manifest.scan(str(root))
+
+    results = [
+        {**result, **POTHOLE, "locality": "Sector 1"}
+        for result in system.process_batch(paths + [str(root / "Sector 3/kept.png")])[:2]
+    ]
+    index = UploadIndex(str(tmp_path / "index.db"))
+    SupabaseConnector("", "", client=stand_in(fail_rate=0.0, latency=0.0)).upsert_batch(results, index)
+    keys = {path: issue_key("Sector 1", "Potholes", content_hash) for path, content_hash in zip(paths, hashes)}
+    assert set(index.lookup(list(keys.values()))) == set(keys.values())
+
+    (root / "Sector 1/gone.png").unlink()
+    (root / "Sector 1/other.png").unlink()
+    manifest.scan(str(root))
+    pruned = prune_deletions(manifest, str(root), system.cache, index)
+
+    assert pruned == {"deleted": 2, "cache_entries": 1, "upload_keys": 1}
+    assert system.cache.get(system.cache.key_for_hash(hashes[0])) is not None
+    assert system.cache.get(system.cache.key_for_hash(hashes[1])) is None
+    assert set(index.lookup(list(keys.values()))) == {keys[paths[0]]}
+    assert manifest.deletions(str(root)) == []
+    system.close()
+    manifest.close()
+    index.close()
+
+
+# ==================== NEAR-DUPLICATE INDEX ====================
+
+def test_near_duplicate_index_forgets_the_oldest_entries():
+    index = NearDuplicateIndex(max_distance=0, max_entries=4)
+    for value in range(5):
+        index.add(value, "Sector 1", NearDuplicate(f"{value}.jpg", None, {}))
+
+    assert index.stats()["indexed"] == 3
+    assert index.find(0, "Sector 1") is None
+    assert index.find(4, "Sector 1").image_path == "4.jpg"
+
+
+def test_near_duplicate_index_keeps_its_own_result():
+    index = NearDuplicateIndex()
+    result = {"potholes": {"status": "present"}}
+    index.add(1, None, NearDuplicate("a.jpg", None, result))
+
+    result["potholes"]["status"] = "edited by the caller"
+
+    assert index.find(1, None).result == {"potholes": {"status": "present"}}
+
+
+def test_near_duplicates_use_the_given_localities(tmp_path):
+    image = np.random.default_rng(1).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    paths = [str(tmp_path / f"photo_{index}.png") for index in range(3)]
+    for path in paths:
+        cv2.imwrite(path, image)
+    localities = dict(zip(paths, ["Ward 1", "Ward 2", "Ward 1"]))
+
+    system = CompleteCivicIssueDetectionSystem(model_type="mock", dedup_distance=0, localities=localities)
+    results = system.process_batch(paths)
+
+    assert [result.get("duplicate_of") for result in results] == [None, None, paths[0]]
+
+
+# ==================== INSTRUMENTATION ====================
+
+@pytest.fixture
+def metrics():
+    METRICS.reset()
+    METRICS.enable()
+    yield METRICS
+    METRICS.disable()
+    METRICS.reset()
+
+
+def test_stage_exits_every_hook_when_one_fails():
+    registry = MetricsRegistry()
+    exited = []
+
+    class Tracked:
+        def __init__(self, stage):
+            self.stage = stage
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            exited.append(self.stage)
+
+    class BrokenExit(Tracked):
+        def __exit__(self, *exc_info):
+            raise RuntimeError("hook failed on exit")
+
+    def broken_enter(stage):
+        raise RuntimeError("hook failed on enter")
+
+    registry.add_hook(Tracked)
+    registry.add_hook(broken_enter)
+    with pytest.raises(RuntimeError, match="on enter"):
+        with registry.stage("detect"):
+            pass
+    assert exited == ["detect"]
+
+    registry.remove_hook(broken_enter)
+    registry.add_hook(BrokenExit)
+    with pytest.raises(RuntimeError, match="on exit"):
+        with registry.stage("classify"):
+            pass
+    assert exited == ["detect", "classify"]
+
+
+def stage_count(registry, stage):
+    return sum(
+        histogram["count"] for histogram in registry.snapshot()["histograms"]
+        if histogram["name"] == "civic_stage_duration_seconds" and histogram["labels"] == {"stage": stage}
+    )
+
+
+def test_parallel_batches_merge_worker_metrics(tmp_path, metrics):
+    paths = write_images(tmp_path, [32, 40, 48, 56])
+
+    with CompleteCivicIssueDetectionSystem(model_type="mock", workers=2, chunk_size=1) as system:
+        results = system.process_batch_parallel(paths)
+
+    assert not any("error" in result for result in results)
+    assert stage_count(metrics, "decode") == len(paths)
+
+
+def test_parallel_batches_keep_a_bounded_window_of_chunks_in_flight(tmp_path, monkeypatch):
+    paths = write_images(tmp_path, [32] * 20)
+
+    with CompleteCivicIssueDetectionSystem(model_type="mock", workers=2, chunk_size=1) as system:
+        pool = system._get_pool(2)
+        submitted = []
+        submit = pool.submit
+
+        def counting_submit(fn, chunk, *args):
+            submitted.append(chunk)
+            return submit(fn, chunk, *args)
+
+        monkeypatch.setattr(pool, "submit", counting_submit)
+
+        results = system.iter_batch(paths)
+        assert next(results)["image"] == paths[0]
+        assert len(submitted) == 5
+        assert len(list(results)) == len(paths) - 1
+        assert submitted == [[path] for path in paths]
+
+
+# ==================== STREAMING PIPELINE ====================
+
+class CountingPaths:
+    """Lazy image paths that count how many the pipeline has taken"""
+
+    def __init__(self, paths, fail_after=None):
+        self.paths = paths
+        self.fail_after = fail_after
+        self.taken = 0
+
+    def __iter__(self):
+        for path in self.paths:
+            if self.taken == self.fail_after:
+                raise RuntimeError("listing failed")
+            self.taken += 1
+            yield path
+
+
+def test_pipeline_reads_ahead_only_as_far_as_its_queues(tmp_path):
+    # Missing files fail in the decode stage, so the stages never wait on work
+    paths = CountingPaths([str(tmp_path / f"missing_{i}.png") for i in range(1000)])
+    pipeline = CivicIssuePipeline(CompleteCivicIssueDetectionSystem(model_type="mock"),
+                                  queue_size=2, decode_workers=1)
+
+    results = pipeline.run(paths)
+    next(results)
+    time.sleep(0.3)
+    # Three queues of two, one item held by each stage and the one yielded
+    assert paths.taken <= 10
+    results.close()
+
+
+def test_closing_the_pipeline_early_stops_every_stage(tmp_path):
+    paths = CountingPaths(write_images(tmp_path, [64] * 3) * 100)
+    pipeline = CivicIssuePipeline(CompleteCivicIssueDetectionSystem(model_type="mock"), queue_size=2)
+    threads = threading.active_count()
+
+    results = pipeline.run(paths)
+    assert "error" not in next(results)
+    results.close()
+
+    assert threading.active_count() == threads
+    assert paths.taken < 300
+
+
+def test_pipeline_raises_the_input_error_after_draining(tmp_path):
+    paths = CountingPaths(write_images(tmp_path, [64, 96, 128, 160]), fail_after=3)
+    pipeline = CivicIssuePipeline(CompleteCivicIssueDetectionSystem(model_type="mock"))
+
+    seen = []
+    with pytest.raises(RuntimeError, match="listing failed"):
+        for result in pipeline.run(paths):
+            seen.append(result["image_path"])
+    assert sorted(seen) == paths.paths[:3]
+
+
+def test_pipeline_upload_summary_keeps_a_bounded_error_list(tmp_path):
+    def insert_batch_bulk(results, chunk_size):
+        errors = [{"image_path": result["image_path"], "error": "rejected"} for result in results]
+        return {"total_images": len(results), "total_issues": len(results), "successful": 0,
+                "failed": len(results), "duplicates_collapsed": 0, "errors": errors}
+
+    uploader = SimpleNamespace(generate_title_and_description=lambda result: [],
+                               insert_batch_bulk=insert_batch_bulk)
+    pipeline = CivicIssuePipeline(CompleteCivicIssueDetectionSystem(model_type="mock"),
+                                  uploader=uploader, max_errors=2)
+
+    assert len(list(pipeline.run(write_images(tmp_path, [64, 96, 128, 160])))) == 4
+    assert pipeline.upload_summary["failed"] == 4
+    assert len(pipeline.upload_summary["errors"]) == 2
+
+
+# ==================== WORKER POOL ====================
+
+def take_module_locks():
+    locks = (METRICS._lock, classifier._mock_label_table_lock)
+    raise SystemExit(0 if all(lock.acquire(timeout=5) for lock in locks) else 1)
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_forked_child_gets_fresh_module_locks():
+    with METRICS._lock, classifier._mock_label_table_lock:
+        child = multiprocessing.get_context("fork").Process(target=take_module_locks)
+        child.start()
+    child.join(30)
+
+    assert child.exitcode == 0
+
+
+def test_deferred_warm_up_runs_on_first_get_that_does_not_defer():
+    registry = ModelRegistry()
+    warmed = []
+
+    cached = registry.get(("yolo", "w.pt"), object, warmed.append, defer_warm_up=True)
+    assert not cached.warmed and cached.fork_safe and warmed == []
+
+    assert registry.get(("yolo", "w.pt"), object, warmed.append) is cached
+    registry.get(("yolo", "w.pt"), object, warmed.append)
+    assert cached.warmed and not cached.fork_safe
+    assert warmed == [cached.model]
+    assert registry.stats()["loads"] == 1
+
+
+def test_forked_registry_keeps_only_models_that_survive_fork():
+    registry = ModelRegistry()
+    registry.get(("mock",), object, lambda model: None)
+    registry.get(("yolo", "cold.pt"), object, lambda model: None, defer_warm_up=True)
+    registry.get(("yolo", "warm.pt"), object, lambda model: None)
+    registry.get(("onnx", "cold.onnx"), object, lambda model: None, defer_warm_up=True)
+
+    registry._after_fork_in_child()
+
+    assert set(registry._models) == {("mock",), ("yolo", "cold.pt")}
+    assert not registry._models[("yolo", "cold.pt")].warmed
+
+
+@pytest.mark.skipif(not classifier.YOLO_AVAILABLE, reason="needs ultralytics")
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="needs smaps_rollup")
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_forked_yolo_workers_hold_less_private_memory(tmp_path):
+    paths = write_images(tmp_path, [480] * 8)
+
+    report = benchmark.run_worker_memory_benchmark(paths, use_yolo=True, workers=2)
+
+    own, shared = report["runs"]
+    assert own["errors"] == shared["errors"] == 0
+    assert shared["mean_uss_mb"] < own["mean_uss_mb"]
+
+
+# ==================== BENCHMARK ====================
+
+def test_synthetic_images_exercise_every_category():
+    vision = classifier.VisionModelWrapper(model_type="mock")
+    issues = EnhancedCivicIssueClassifier()
+    statuses = {category: set() for category in benchmark.CATEGORIES}
+
+    for seed in range(12):
+        image = benchmark.synthetic_civic_image(640, 480, seed)
+        for category, result in issues.classify_all_issues(vision.detect(image), image).items():
+            statuses[category].add(result["status"])
+
+    assert all(len(seen) >= 2 for seen in statuses.values()), statuses
+
+
+def test_stage_benchmark_reports_percentiles_for_every_stage(tmp_path):
+    paths = benchmark.generate_synthetic_images(str(tmp_path), ((320, 240), (480, 360)), per_resolution=3)
+    assert benchmark.generate_synthetic_images(str(tmp_path), ((320, 240), (480, 360)), per_resolution=3) == paths
+
+    with CompleteCivicIssueDetectionSystem(use_yolo=False) as system:
+        report = json.loads(json.dumps(benchmark.run_stage_benchmark(paths, system, warmup=1)))
+
+    expected = {"decode", "detect", "bucket", "report", "total"}
+    expected.update(stage for stage, _ in benchmark.CLASSIFIER_STAGES)
+    assert set(report["stages"]) == expected
+    for summary in report["stages"].values():
+        assert summary["count"] == len(paths)
+        assert summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"] <= summary["max_ms"]
+    assert report["images_per_sec"] > 0 and report["peak_rss_mb"] > 0
+
+
+def test_compare_reports_flags_only_stages_that_slowed_down():
+    def report(detect_ms, images_per_sec=10.0):
+        stages = {
+            "decode": {"p50_ms": 2.0, "p95_ms": 3.0},
+            "detect": {"p50_ms": detect_ms, "p95_ms": detect_ms * 2}
+        }
+        return {"stages": stages, "images_per_sec": images_per_sec}
+
+    assert benchmark.percentile(list(range(1, 101)), 95) == 95
+    assert benchmark.compare_reports(report(10.0), report(10.5), threshold=10.0) == []
+    assert benchmark.compare_reports(report(10.0), report(12.0), threshold=10.0) == [
+        "detect p50_ms +20.0%", "detect p95_ms +20.0%"
+    ]